@@ -249,6 +249,7 @@
 
 import streamlit as st
 import time
+import uuid
 import sqlparse
 from pathlib import Path
 import sys
@@ -257,8 +258,14 @@ import sys
 root_dir = Path(__file__).resolve().parent.parent
 sys.path.append(str(root_dir))
 
-from llm.text2sql_agent import generate_sql
-from backend.query_executor import run_sql_query
+from pipeline import repair
+from backend import resources
+from backend.guard import QueryRejected, check_query
+from backend.session_store import get_session_store
+from backend.results import ResultHandle
+from backend import speculation
+from backend.worker_pool import QueryCancelled, get_query_service
+from observability import metrics
 
 # --------------------------
 # Page Config
@@ -269,24 +276,142 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Build the schema, engine, query workers and LLM backend in the background,
+# once per process, while the first page renders and the user types
+@st.cache_resource(show_spinner=False)
+def start_warmup():
+    return resources.warm()
+
+
+start_warmup()
+
 # --------------------------
 # Session State Setup
 # --------------------------
-if "chat_log" not in st.session_state:
-    st.session_state.chat_log = []
-
 if "pending_question" not in st.session_state:
     st.session_state.pending_question = None
 
 if "pending_sql" not in st.session_state:
     st.session_state.pending_sql = None
 
+# Holds a ResultHandle; rows are paged from the engine on demand
 if "query_result" not in st.session_state:
     st.session_state.query_result = None
 
+if "answered_question" not in st.session_state:
+    st.session_state.answered_question = None
+
+# GuardDecision waiting for the user to confirm an expensive query
+if "guard_decision" not in st.session_state:
+    st.session_state.guard_decision = None
+
 if "reset_input" not in st.session_state:
     st.session_state.reset_input = False
 
+# Spans recorded while generating and running the current query
+if "timings" not in st.session_state:
+    st.session_state.timings = {}
+
+# Identifies this browser session to the query service's fair scheduler
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+# Query job submitted to the worker pool and not yet collected
+if "running_job" not in st.session_state:
+    st.session_state.running_job = None
+
+# Sidebar history lives in the session store; only the page shown is kept here
+if "history_page" not in st.session_state:
+    st.session_state.history_page = 0
+
+HISTORY_PAGE_SIZE = 10
+
+# Speculation started on pending_sql before Run was clicked
+if "speculation" not in st.session_state:
+    st.session_state.speculation = None
+
+# (level, message) about automatic repairs of pending_sql
+if "repair_note" not in st.session_state:
+    st.session_state.repair_note = None
+
+# Repairs spent on pending_question after its SQL failed at run time,
+# and the (sql, error) failures they fixed
+if "run_repairs" not in st.session_state:
+    st.session_state.run_repairs = 0
+    st.session_state.run_failures = []
+
+POLL_INTERVAL = 0.2
+# A job this script stops polling (tab closed, session gone) is cancelled after this long
+HEARTBEAT = 10.0
+
+
+# Stop the query this session is running, if any
+def _cancel_running():
+    running = st.session_state.get("running_job")
+    service = get_query_service()
+    if running is not None and service is not None:
+        service.cancel(running["id"])
+    st.session_state.running_job = None
+
+
+# Add the pending question to this session's history
+def _log_question():
+    get_session_store().add_history(st.session_state.session_id,
+                                    st.session_state.pending_question, st.session_state.pending_sql)
+    st.session_state.history_page = 0
+
+
+# Store a successful run and move the question into the chat log
+def _finish_run(handle, decision):
+    # The repaired SQL ran: remember the fix for next time
+    if st.session_state.run_failures:
+        repair.remember_fix(st.session_state.pending_question, st.session_state.run_failures,
+                            st.session_state.pending_sql)
+        st.session_state.run_failures = []
+    st.session_state.query_result = handle
+    st.session_state.guard_notice = decision.reason if decision.action in ("limit", "sample") else None
+    st.session_state.guard_decision = None
+    st.session_state.pop("result_page", None)
+
+    _log_question()
+
+    # Clear pending
+    st.session_state.answered_question = st.session_state.pending_question
+    st.session_state.pending_question = None
+    st.session_state.pending_sql = None
+
+
+# Swap pending_sql for a repaired version after it failed at run time.
+# Returns False when the error is not the SQL's fault or the budget is spent.
+def _repair_pending(error) -> bool:
+    if not repair.is_repairable(error) or st.session_state.run_repairs >= repair.MAX_REPAIRS:
+        return False
+    st.session_state.run_repairs += 1
+    st.session_state.run_failures.append((st.session_state.pending_sql, str(error)))
+    with metrics.trace() as spans:
+        fixed, _ = repair.repair_sql(st.session_state.pending_question, st.session_state.pending_sql, str(error))
+    st.session_state.timings["Repair"] = spans
+    speculation.discard(st.session_state.speculation)
+    st.session_state.speculation = None
+    st.session_state.pending_sql = sqlparse.format(fixed, reindent=True, keyword_case="upper")
+    st.session_state.repair_note = (
+        "info", f"🔧 The query failed ({repair.error_signature(str(error))}), so the SQL was repaired. Run it again.")
+    return True
+
+
+def _run_failed(error):
+    if _repair_pending(error):
+        st.rerun()
+    st.error(f"❌ Query failed: {error}")
+
+
+# Queue wait and run time of a finished job, in the trace() span format
+def _job_spans(job):
+    return [
+        {"span": "job_queue_wait", "ms": round((job.started_at - job.submitted_at) * 1000, 3)},
+        {"span": "job_run", "ms": round((job.finished_at - job.started_at) * 1000, 3)},
+    ]
+
 # --------------------------
 # Reset Input if Triggered
 # --------------------------
@@ -301,17 +426,44 @@ if st.session_state.reset_input:
 with st.sidebar:
     st.title("History")
     if st.button("Start New Chat"):
+        # Abandoned queries would otherwise keep a worker busy
+        service = get_query_service()
+        if service is not None:
+            service.cancel_session(st.session_state.session_id)
+        get_session_store().drop_session(st.session_state.session_id)
         for key in list(st.session_state.keys()):
             del st.session_state[key]
         st.rerun()
 
-    if st.session_state.get("chat_log"):
-        for idx, chat in enumerate(st.session_state.chat_log):
+    history_total = get_session_store().history_count(st.session_state.session_id)
+    history_pages = max(1, -(-history_total // HISTORY_PAGE_SIZE))
+    st.session_state.history_page = min(st.session_state.history_page, history_pages - 1)
+    history, _ = get_session_store().history(st.session_state.session_id,
+                                             st.session_state.history_page, HISTORY_PAGE_SIZE)
+    if history:
+        for chat in history:
             with st.expander(f"{chat['question']}"):
                 st.code(chat['sql'], language="sql")
+        if history_pages > 1:
+            prev_col, page_col, next_col = st.columns([1, 2, 1])
+            with prev_col:
+                if st.button("◀", key="history_prev", disabled=st.session_state.history_page == 0):
+                    st.session_state.history_page -= 1
+                    st.rerun()
+            with page_col:
+                st.caption(f"Page {st.session_state.history_page + 1} of {history_pages}")
+            with next_col:
+                if st.button("▶", key="history_next",
+                             disabled=st.session_state.history_page >= history_pages - 1):
+                    st.session_state.history_page += 1
+                    st.rerun()
     else:
         st.write("No history yet.")
 
+    st.checkbox("Show timing breakdown", key="show_timings")
+    st.checkbox("Pre-run generated SQL", value=speculation.ENABLED, key="speculate",
+                help="Check and start running the SQL as soon as it is generated")
+
 # --------------------------
 # Custom Styling
 # --------------------------
@@ -376,13 +528,36 @@ user_input = st.text_input(
     key="user_input"
 )
 
-if user_input and not st.session_state.pending_sql:
+if (user_input and not st.session_state.pending_sql
+        and user_input != st.session_state.answered_question):
     with st.spinner("Generating SQL..."):
         try:
-            sql = generate_sql(user_input)
-            formatted_sql = sqlparse.format(sql, reindent=True, keyword_case="upper")
+            # Generated SQL is validated with EXPLAIN and repaired before it is shown
+            with metrics.trace() as spans:
+                outcome = repair.answer(user_input)
+            st.session_state.timings = {"Generate": spans}
+            formatted_sql = sqlparse.format(outcome.sql, reindent=True, keyword_case="upper")
+            st.session_state.run_repairs = 0
+            st.session_state.run_failures = []
+            st.session_state.repair_note = None
+            if outcome.error:
+                st.session_state.repair_note = (
+                    "error", f"❌ This SQL still fails after {len(outcome.attempts)} attempts: "
+                             f"{repair.error_signature(outcome.error)}")
+            elif outcome.repaired:
+                st.session_state.repair_note = (
+                    "info", f"🔧 Fixed automatically after {len(outcome.attempts) - 1} repair(s).")
             st.session_state.pending_question = user_input
             st.session_state.pending_sql = formatted_sql
+            st.session_state.query_result = None
+            st.session_state.guard_decision = None
+            speculation.discard(st.session_state.speculation)
+            st.session_state.speculation = None
+            if st.session_state.get("speculate"):
+                with metrics.trace() as spans:
+                    st.session_state.speculation = speculation.speculate(
+                        formatted_sql, session=st.session_state.session_id)
+                st.session_state.timings["Speculate"] = spans
         except Exception as e:
             st.error(f"Error generating SQL: {e}")
 
@@ -392,66 +567,190 @@ if user_input and not st.session_state.pending_sql:
 if st.session_state.pending_sql:
     st.markdown(f"<pre><code class='language-sql'>{st.session_state.pending_sql}</code></pre>", unsafe_allow_html=True)
 
+    note = st.session_state.repair_note
+    spec = st.session_state.speculation
+    if note is not None:
+        (st.error if note[0] == "error" else st.info)(note[1])
+    elif spec is not None and spec.sql == st.session_state.pending_sql and spec.error:
+        st.error(f"❌ This SQL will not run: {spec.error}")
+
     col1, col2 = st.columns(2)
     with col1:
         if st.button("📝 Submit Another Query", key="submit_another_top"):
-            st.session_state.chat_log.append({
-                "question": st.session_state.pending_question,
-                "sql": st.session_state.pending_sql
-            })
+            _cancel_running()
+            speculation.discard(st.session_state.speculation)
+            st.session_state.speculation = None
+            _log_question()
             st.session_state.pending_question = None
             st.session_state.pending_sql = None
             st.session_state.reset_input = True
             st.rerun()
 
     with col2:
-        if st.button("▶️ Run Query", key="run_query_button"):
+        run_clicked = st.button("▶️ Run Query", key="run_query_button",
+                                disabled=st.session_state.running_job is not None)
+
+    # Cost guard: generated SQL is EXPLAINed first and may be capped,
+    # sampled, held for confirmation or refused
+    decision = None
+    spec = st.session_state.speculation
+    if (run_clicked and spec is not None and spec.decision is not None
+            and spec.sql == st.session_state.pending_sql):
+        # Already checked (and maybe already run) in the background
+        st.session_state.speculation = None
+        decision = spec.decision
+        if decision.action == "confirm":
+            st.session_state.guard_decision = decision
+            decision = None
+        else:
+            job_id = speculation.claim(spec, heartbeat=HEARTBEAT)
+            if job_id is not None:
+                st.session_state.running_job = {"id": job_id, "handle": spec.handle, "decision": decision,
+                                                "speculation": spec}
+                st.rerun()
+    elif run_clicked:
+        try:
+            with metrics.trace() as spans:
+                decision = check_query(st.session_state.pending_sql)
+            st.session_state.timings["Guard"] = spans
+            if decision.action == "confirm":
+                st.session_state.guard_decision = decision
+                decision = None
+        except QueryRejected as e:
+            st.error(f"❌ {e}")
+        except Exception as e:
+            st.error(f"❌ Query failed: {e}")
+
+    if st.session_state.guard_decision is not None:
+        st.warning(f"⚠️ {st.session_state.guard_decision.reason}. Run it anyway?")
+        if st.button("Run anyway", key="confirm_run_button"):
+            decision = st.session_state.guard_decision
+
+    if decision is not None:
+        handle = ResultHandle(decision.sql, session=st.session_state.session_id)
+        service = get_query_service()
+        if service is None:
             with st.spinner("Running SQL..."):
                 try:
-                    df = run_sql_query(st.session_state.pending_sql)
-                    st.session_state.query_result = df
-
-                    # Append to chat log
-                    st.session_state.chat_log.append({
-                        "question": st.session_state.pending_question,
-                        "sql": st.session_state.pending_sql
-                    })
-
-                    # Clear pending
-                    st.session_state.pending_question = None
-                    st.session_state.pending_sql = None
-
-                    # --------------------------
-                    # Centered Results
-                    # --------------------------
-                    with st.container():
-                        st.markdown(
-                            """
-                            <div style='text-align: center; font-weight: bold; font-size: 18px; color: green; margin-bottom: 1em;'>
-                                Query executed successfully!
-                            </div>
-                            """,
-                            unsafe_allow_html=True
-                        )
-
-                        st.markdown("<div style='display: flex; justify-content: center;'>", unsafe_allow_html=True)
-                        st.dataframe(df, height=500)
-                        st.markdown("</div>", unsafe_allow_html=True)
-
-                        st.markdown(
-                            "<div style='text-align: center; margin-top: 2em; font-size: 20px;'>What would you like to do next?</div>",
-                            unsafe_allow_html=True
-                        )
-
-                        c1, c2, c3 = st.columns([1, 1, 1])
-                        with c1:
-                            if st.button("📝 Submit Another Query", key="submit_another_bottom"):
-                                st.session_state.reset_input = True
-                                st.rerun()
-                        with c2:
-                            st.button("📊 Visualize This Data", key="visualize_button")
-                        with c3:
-                            st.button("🤖 Train/Test ML Model", key="ml_model_button")
+                    # Keep a handle, not a DataFrame; fetching the first page surfaces SQL errors now
+                    with metrics.trace() as spans:
+                        handle.page(0)
+                    st.session_state.timings["Run"] = spans
+                    _finish_run(handle, decision)
+                    st.rerun()
+                except Exception as e:
+                    _run_failed(e)
+        else:
+            # The query runs on the worker pool; this script only polls
+            job_id = service.submit(handle.result_sql(), session=st.session_state.session_id,
+                                    heartbeat=HEARTBEAT)
+            st.session_state.running_job = {"id": job_id, "handle": handle, "decision": decision}
+            st.rerun()
 
+    if st.session_state.running_job is not None:
+        running = st.session_state.running_job
+        service = get_query_service()
+        try:
+            job = service.poll(running["id"])
+        except KeyError:
+            job = None
+            st.session_state.running_job = None
+            st.error("❌ Query failed: the result expired before it was collected")
+        if job is not None and not job.finished:
+            if job.state == "running":
+                elapsed = time.time() - job.started_at
+                percent = job.progress or 0.0
+                label = f"{percent:.0f}%" if job.progress is not None else "estimating"
+                st.progress(min(percent, 100.0) / 100, text=f"⏳ Running SQL... {label} · {elapsed:.1f}s")
+            else:
+                st.progress(0.0, text="⏳ Waiting for a query worker...")
+            if st.button("⏹️ Cancel", key="cancel_query_button"):
+                _cancel_running()
+                st.warning("Query cancelled.")
+            else:
+                time.sleep(POLL_INTERVAL)
+                st.rerun()
+        elif job is not None:
+            st.session_state.running_job = None
+            try:
+                table = service.result(job.id)
+                spec = running.get("speculation")
+                if spec is not None and not speculation.is_complete(spec, table):
+                    # The speculative run only fetched the first page; fetch the whole result
+                    running["id"] = service.submit(running["handle"].result_sql(),
+                                                   session=st.session_state.session_id, heartbeat=HEARTBEAT)
+                    running["speculation"] = None
+                    st.session_state.running_job = running
+                    st.rerun()
+                running["handle"].set_result(table)
+                st.session_state.timings["Run"] = _job_spans(job)
+                _finish_run(running["handle"], running["decision"])
+                st.rerun()
+            except QueryCancelled:
+                st.warning("Query cancelled.")
+            except Exception as e:
+                _run_failed(e)
 
+# --------------------------
+# Centered Results
+# --------------------------
+if st.session_state.query_result is not None:
+    handle = st.session_state.query_result
+    with st.container():
+        st.markdown(
+            """
+            <div style='text-align: center; font-weight: bold; font-size: 18px; color: green; margin-bottom: 1em;'>
+                Query executed successfully!
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
 
+        try:
+            page_count = handle.page_count()
+            page = 1
+            if page_count > 1:
+                page = st.number_input("Page", min_value=1, max_value=page_count, value=1, key="result_page")
+
+            st.markdown("<div style='display: flex; justify-content: center;'>", unsafe_allow_html=True)
+            st.dataframe(handle.page(page - 1), height=500)
+            st.markdown("</div>", unsafe_allow_html=True)
+
+            caption = f"{handle.row_count():,} rows"
+            if handle.is_truncated:
+                caption += f" (showing the first {handle.max_rows:,})"
+            st.caption(caption)
+            if st.session_state.get("guard_notice"):
+                st.info(st.session_state.guard_notice)
+        except Exception as e:
+            st.error(f"❌ Query failed: {e}")
+
+        st.markdown(
+            "<div style='text-align: center; margin-top: 2em; font-size: 20px;'>What would you like to do next?</div>",
+            unsafe_allow_html=True
+        )
+
+        c1, c2, c3 = st.columns([1, 1, 1])
+        with c1:
+            if st.button("📝 Submit Another Query", key="submit_another_bottom"):
+                st.session_state.query_result = None
+                st.session_state.reset_input = True
+                st.rerun()
+        with c2:
+            st.button("📊 Visualize This Data", key="visualize_button")
+        with c3:
+            st.button("🤖 Train/Test ML Model", key="ml_model_button")
+
+# --------------------------
+# Timing Breakdown
+# --------------------------
+if st.session_state.get("show_timings") and st.session_state.timings:
+    with st.expander("⏱️ Timing breakdown", expanded=True):
+        for phase, spans in st.session_state.timings.items():
+            st.markdown(f"**{phase}**")
+            if spans:
+                import pandas as pd
+
+                st.dataframe(pd.DataFrame(spans).fillna(""), hide_index=True)
+            else:
+                st.caption("No spans recorded.")
@@ -0,0 +1,647 @@
+# backend/aggregates.py
+# Materialized rollups of the fact tables and a rewrite step that routes
+# matching aggregate queries to them. Each rollup is kept as one partial
+# aggregate per source file, so a refresh only rescans files that changed.
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from backend.engine import get_engine
+from backend.ingest import _lit, source_version, store_lock
+from backend.result_cache import referenced_tables
+from observability import metrics
+
+ENABLED = os.getenv("MATERIALIZED_AGGREGATES", "1") not in ("0", "false", "False")
+REWRITE_CACHE_SIZE = 1024
+MANIFEST_NAME = "_manifest.json"
+ROW_COUNT = "ROW_COUNT"
+
+# name -> rollup definition. Every measure gets <col>_SUM, <col>_COUNT,
+# <col>_MIN and <col>_MAX columns; the `month` column is kept truncated to
+# the month as <col>_MONTH.
+AGGREGATES = {
+    "agg_claims_by_segment": {
+        "table": "claims",
+        "dimensions": ["LINE_OF_BUSINESS", "STATE", "CLAIM_TYPE", "CLAIM_STATUS", "IS_CLOSED"],
+        "month": "DATE_REPORTED",
+        "measures": ["CLAIM_AMOUNT", "IS_CLOSED"],
+    },
+    "agg_claims_by_broker": {
+        "table": "claims",
+        "dimensions": ["BROKER_ID", "LINE_OF_BUSINESS", "CLAIM_STATUS", "IS_CLOSED"],
+        "month": "DATE_REPORTED",
+        "measures": ["CLAIM_AMOUNT", "IS_CLOSED"],
+    },
+    "agg_policies_by_lob": {
+        "table": "policies",
+        "dimensions": ["LINE_OF_BUSINESS"],
+        "month": "START_DATE",
+        "measures": ["PREMIUM_AMOUNT"],
+    },
+}
+
+# Plain views over the rollups, for dashboards that query them directly
+DERIVED_VIEWS = {
+    "agg_loss_ratio_by_lob": (["agg_claims_by_segment", "agg_policies_by_lob"], """
+        SELECT LINE_OF_BUSINESS,
+               c.CLAIM_AMOUNT AS TOTAL_CLAIM_AMOUNT,
+               p.PREMIUM_AMOUNT AS TOTAL_PREMIUM_AMOUNT,
+               CAST(c.CLAIM_AMOUNT AS DOUBLE) / NULLIF(p.PREMIUM_AMOUNT, 0) AS LOSS_RATIO
+        FROM (SELECT LINE_OF_BUSINESS, sum(CLAIM_AMOUNT_SUM) AS CLAIM_AMOUNT
+              FROM agg_claims_by_segment GROUP BY ALL) AS c
+        FULL JOIN (SELECT LINE_OF_BUSINESS, sum(PREMIUM_AMOUNT_SUM) AS PREMIUM_AMOUNT
+                   FROM agg_policies_by_lob GROUP BY ALL) AS p
+        USING (LINE_OF_BUSINESS)
+    """),
+}
+
+
+
+# Base tables a rollup or derived view is built from
+def rollup_sources(names) -> set:
+    tables = set()
+    for name in names:
+        if name in DERIVED_VIEWS:
+            tables |= rollup_sources(DERIVED_VIEWS[name][0])
+        else:
+            tables.add(AGGREGATES[name]["table"])
+    return tables
+
+
+# Base tables behind the rollups and derived views `sql` reads by name.
+# Most queries name none, so they are not parsed.
+def source_tables(sql: str) -> set:
+    names = [n for n in list(AGGREGATES) + list(DERIVED_VIEWS) if n in sql.lower()]
+    return rollup_sources(referenced_tables(sql, names)) if names else set()
+
+
+INTEGER_TYPES = {"TINYINT", "SMALLINT", "INTEGER", "BIGINT", "UTINYINT", "USMALLINT", "UINTEGER"}
+
+# Functions whose value is the same for every timestamp in a calendar month,
+# so they can read the month-truncated column instead of the raw one
+MONTH_PARTS = {"month", "months", "mon", "quarter", "quarters", "year", "years", "yr", "y",
+               "decade", "century", "millennium"}
+MONTH_FUNCTIONS = {"year", "month", "quarter", "monthname", "last_day"}
+PART_FUNCTIONS = {"date_trunc", "datetrunc", "date_part", "datepart"}
+MONTH_FORMATS = set("YymBbC%")
+
+# Aggregate calls on a rollup; "__m__" is the rollup column holding the partial
+TEMPLATES = {
+    "count_star": "CAST(COALESCE(sum(__m__), 0) AS BIGINT)",
+    "count": "CAST(COALESCE(sum(__m__), 0) AS BIGINT)",
+    "sum": "sum(__m__)",
+    "min": "min(__m__)",
+    "max": "max(__m__)",
+    "avg": "CAST(sum(__m__) AS DOUBLE) / NULLIF(sum(__n__), 0)",
+}
+ROLLUP_SUFFIX = {"count": "_COUNT", "sum": "_SUM", "min": "_MIN", "max": "_MAX"}
+
+
+class _NoMatch(Exception):
+    pass
+
+
+def _rollup_sql(name: str, source: str, integer_measures: set, merge: bool = False) -> str:
+    spec = AGGREGATES[name]
+    cols = list(spec["dimensions"])
+    if merge:
+        if spec.get("month"):
+            cols.append(f"{spec['month']}_MONTH")
+        cols.append(f"CAST(sum({ROW_COUNT}) AS BIGINT) AS {ROW_COUNT}")
+    else:
+        if spec.get("month"):
+            cols.append(f"date_trunc('month', {spec['month']}) AS {spec['month']}_MONTH")
+        cols.append(f"count(*) AS {ROW_COUNT}")
+    for m in spec["measures"]:
+        if merge:
+            total = f"sum({m}_SUM)"
+            cols += [f"CAST(sum({m}_COUNT) AS BIGINT) AS {m}_COUNT",
+                     f"min({m}_MIN) AS {m}_MIN", f"max({m}_MAX) AS {m}_MAX"]
+        else:
+            total = f"sum({m})"
+            cols += [f"count({m}) AS {m}_COUNT", f"min({m}) AS {m}_MIN", f"max({m}) AS {m}_MAX"]
+        # Parquet has no HUGEINT; integer sums are kept exact as BIGINT
+        cols.append(f"CAST({total} AS BIGINT) AS {m}_SUM" if m in integer_measures else f"{total} AS {m}_SUM")
+    return f"SELECT {', '.join(cols)} FROM {source} GROUP BY ALL"
+
+
+# Rollups of the engine's tables, stored next to the columnar store and
+# registered as views on the engine
+class AggregateStore:
+    def __init__(self, engine, store_dir: Path = None):
+        self.engine = engine
+        self.dir = Path(store_dir or engine.store_dir) / "_aggregates"
+        self._lock = threading.Lock()
+        self._manifest = self._load_manifest()
+        self._built = {}  # name -> table data version the view reflects
+        self._rewrites = OrderedDict()
+        self._agg_functions = None
+
+    def _load_manifest(self) -> dict:
+        path = self.dir / MANIFEST_NAME
+        if not path.exists():
+            return {}
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def _write_manifest(self):
+        path = self.dir / MANIFEST_NAME
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self._manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _spec_hash(name: str) -> str:
+        return hashlib.sha256(json.dumps(AGGREGATES[name], sort_keys=True).encode()).hexdigest()[:16]
+
+    # Names of the rollups whose views are up to date with their table.
+    # Refreshes the stale ones first.
+    def ensure_fresh(self, tables=None) -> list:
+        known = set(self.engine.tables)
+        names = [n for n, spec in AGGREGATES.items()
+                 if spec["table"] in known and (tables is None or spec["table"] in tables)]
+        if not names:
+            return []
+        versions = self.engine.data_versions(sorted({AGGREGATES[n]["table"] for n in names}))
+        stale = [n for n in names if self._built.get(n) != versions[AGGREGATES[n]["table"]]]
+        if stale:
+            with self._lock:
+                stale = [n for n in stale if self._built.get(n) != versions[AGGREGATES[n]["table"]]]
+                if stale:
+                    self.refresh(stale, versions)
+        return names
+
+    # Rebuild partials for changed source files, merge them and repoint the views
+    def refresh(self, names=None, versions=None):
+        names = list(AGGREGATES) if names is None else names
+        versions = versions or self.engine.data_versions(sorted({AGGREGATES[n]["table"] for n in names}))
+        with store_lock(self.dir.parent), self.engine.cursor() as cur:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            # Another process may have refreshed partials since we last looked
+            self._manifest = self._load_manifest()
+            for name in names:
+                with metrics.span("aggregate_refresh", aggregate=name):
+                    path = self._refresh_one(cur, name)
+                cur.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM {_lit(path.as_posix())}")
+                self._built[name] = versions[AGGREGATES[name]["table"]]
+            for view, (deps, sql) in DERIVED_VIEWS.items():
+                if all(d in self._built for d in deps):
+                    cur.execute(f"CREATE OR REPLACE VIEW {view} AS {sql}")
+            self._write_manifest()
+
+    def _refresh_one(self, cur, name: str) -> Path:
+        spec = AGGREGATES[name]
+        entry = self._manifest.get(name)
+        if entry is None or entry.get("spec") != self._spec_hash(name):
+            entry = self._manifest[name] = {"spec": self._spec_hash(name), "partials": {}}
+        partials = entry["partials"]
+        merged = self.dir / f"{name}.parquet"
+        changed = not merged.exists()
+
+        # (partial key, what to scan, version) per source file. Rows of a raw
+        # delta may replace rows of earlier files, so an upserted table is
+        # rolled up from its view as one partial that changes with any file.
+        table = spec["table"]
+        if self.engine.is_upserted(table):
+            version = json.loads(json.dumps(source_version(self.engine.data_dir, table)))
+            sources = [(table, table, version)]
+        else:
+            sources = []
+            for path in self.engine.table_files(table):
+                stat = path.stat()
+                sources.append((path.as_posix(), _lit(path.as_posix()), [stat.st_mtime_ns, stat.st_size]))
+        described = cur.execute(f"DESCRIBE SELECT * FROM {sources[0][1]}").fetchall()
+        integer_measures = {col for col, col_type, *_ in described
+                            if col in spec["measures"] and col_type in INTEGER_TYPES}
+
+        seen = set()
+        for key, scan, version in sources:
+            seen.add(key)
+            part = partials.get(key)
+            if part and part["version"] == version and (self.dir / part["file"]).exists():
+                continue
+            file_name = f"{name}/{hashlib.sha1(key.encode()).hexdigest()[:16]}.parquet"
+            target = self.dir / file_name
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp = target.with_suffix(".parquet.tmp")
+            sql = _rollup_sql(name, scan, integer_measures)
+            cur.execute(f"COPY ({sql}) TO {_lit(tmp.as_posix())} (FORMAT parquet, COMPRESSION zstd)")
+            os.replace(tmp, target)
+            partials[key] = {"version": version, "file": file_name}
+            metrics.incr("aggregate_partials_built", aggregate=name)
+            changed = True
+
+        for key in set(partials) - seen:
+            (self.dir / partials.pop(key)["file"]).unlink(missing_ok=True)
+            changed = True
+
+        if changed:
+            sources = ", ".join(_lit((self.dir / p["file"]).as_posix()) for p in partials.values())
+            tmp = merged.with_suffix(".parquet.tmp")
+            sql = _rollup_sql(name, f"read_parquet([{sources}])", integer_measures, merge=True)
+            cur.execute(f"COPY ({sql}) TO {_lit(tmp.as_posix())} (FORMAT parquet, COMPRESSION zstd)")
+            os.replace(tmp, merged)
+            entry["rows"] = cur.execute(f"SELECT count(*) FROM {_lit(merged.as_posix())}").fetchone()[0]
+        return merged
+
+    # ------------------------------------------------------------------
+    # Query rewrite
+    # ------------------------------------------------------------------
+
+    # Route every aggregate block of `sql` that a rollup can answer to the
+    # smallest such rollup. Returns the query unchanged when nothing matches.
+    # Rollups and derived views the query names itself are brought up to date
+    # (and created) first, also with match=False.
+    def rewrite(self, sql: str, match: bool = True) -> str:
+        tables = source_tables(sql)
+        if match:
+            lowered = sql.lower()
+            tables |= {spec["table"] for spec in AGGREGATES.values() if spec["table"].lower() in lowered}
+        if not tables:
+            return sql
+        ready = self.ensure_fresh(tables)
+        if not match or not ready:
+            return sql
+
+        key = (sql, tuple(ready))
+        with self._lock:
+            result = self._rewrites.get(key)
+            if result is not None:
+                self._rewrites.move_to_end(key)
+        if result is None:
+            with self.engine.cursor() as cur:
+                try:
+                    result = _Rewriter(cur, ready, self._aggregate_functions(cur), self._rows()).rewrite(sql)
+                except Exception:
+                    # Anything the matcher does not understand runs as written
+                    result = None
+            result = result or sql
+            with self._lock:
+                self._rewrites[key] = result
+                while len(self._rewrites) > REWRITE_CACHE_SIZE:
+                    self._rewrites.popitem(last=False)
+        metrics.incr("aggregate_rewrites", result="hit" if result != sql else "miss")
+        return result
+
+    def _aggregate_functions(self, cur) -> set:
+        if self._agg_functions is None:
+            rows = cur.execute("""
+                SELECT DISTINCT function_name FROM duckdb_functions()
+                WHERE function_type = 'aggregate'
+            """).fetchall()
+            self._agg_functions = {r[0].lower() for r in rows} | {"count_star"}
+        return self._agg_functions
+
+    def _rows(self) -> dict:
+        return {name: entry.get("rows", 0) for name, entry in self._manifest.items()}
+
+
+def _walk_nodes(value, visit):
+    # Post-order, so nested blocks are handled before the block containing them
+    if isinstance(value, dict):
+        for child in value.values():
+            _walk_nodes(child, visit)
+        if value.get("type") == "SELECT_NODE":
+            visit(value)
+    elif isinstance(value, list):
+        for child in value:
+            _walk_nodes(child, visit)
+
+
+def _cte_names(value, names: set) -> set:
+    if isinstance(value, dict):
+        for entry in (value.get("cte_map") or {}).get("map", []):
+            names.add(entry["key"].lower())
+        for child in value.values():
+            _cte_names(child, names)
+    elif isinstance(value, list):
+        for child in value:
+            _cte_names(child, names)
+    return names
+
+
+def _sub_expressions(value):
+    # Expression nodes directly below `value` (CASE arms, cast children, ...)
+    if isinstance(value, dict):
+        for key, child in value.items():
+            if isinstance(child, dict) and "class" in child:
+                yield key, child, value
+            elif isinstance(child, (dict, list)) and key != "value":
+                for item in _sub_expressions(child):
+                    yield item
+    elif isinstance(value, list):
+        for i, child in enumerate(value):
+            if isinstance(child, dict) and "class" in child:
+                yield i, child, value
+            else:
+                for item in _sub_expressions(child):
+                    yield item
+
+
+def _descendants(value):
+    for key, child, container in _sub_expressions(value):
+        yield key, child, container
+        yield from _descendants(child)
+
+
+def _constant(expr):
+    if expr.get("class") == "CONSTANT" and not expr["value"].get("is_null"):
+        return expr["value"].get("value")
+    return None
+
+
+# strftime formats that only print the year and month
+def _month_format(fmt) -> bool:
+    if not isinstance(fmt, str):
+        return False
+    i = 0
+    while i < len(fmt):
+        if fmt[i] == "%":
+            if fmt[i + 1:i + 2] not in MONTH_FORMATS:
+                return False
+            i += 2
+        else:
+            i += 1
+    return True
+
+
+# Matches and rewrites the SELECT blocks of one statement on a DuckDB AST
+# produced by json_serialize_sql
+class _Rewriter:
+    def __init__(self, cur, ready: list, agg_functions: set, rows: dict):
+        self.cur = cur
+        self.ready = ready
+        self.agg_functions = agg_functions
+        self.rows = rows
+        self.changed = False
+
+    def rewrite(self, sql: str):
+        tree = json.loads(self.cur.execute("SELECT json_serialize_sql(?::VARCHAR)", [sql]).fetchone()[0])
+        if tree.get("error") or len(tree["statements"]) != 1:
+            return None
+        self.ctes = _cte_names(tree, set())
+        _walk_nodes(tree, self._visit)
+        if not self.changed:
+            return None
+        return self.cur.execute("SELECT json_deserialize_sql(?::JSON)", [json.dumps(tree)]).fetchone()[0]
+
+    def _visit(self, node: dict):
+        ref = node.get("from_table") or {}
+        if (ref.get("type") != "BASE_TABLE" or ref.get("sample") or node.get("sample")
+                or node.get("qualify") or ref.get("catalog_name")
+                or ref.get("schema_name", "").lower() not in ("", "main")):
+            return
+        table = ref["table_name"].lower()
+        if not ref.get("schema_name") and table in self.ctes:
+            return
+        candidates = [n for n in self.ready if AGGREGATES[n]["table"].lower() == table]
+        if not candidates:
+            return
+        self.candidates = candidates
+
+        self.qualifiers = {(ref.get("alias") or ref["table_name"]).lower()}
+        if not ref.get("alias"):
+            self.qualifiers.add(table)
+        self.aliases = {item["alias"].lower() for item in node["select_list"] if item.get("alias")}
+        spec = AGGREGATES[candidates[0]]
+        self.columns = {c.lower(): c for name in candidates
+                        for c in AGGREGATES[name]["dimensions"] + AGGREGATES[name]["measures"]}
+        self.month = spec.get("month")
+        self.dims, self.measures, self.uses_month, self.aggregates = set(), set(), False, False
+
+        try:
+            for item in node["select_list"]:
+                self._scan(item)
+            for key in ("where_clause", "having"):
+                if node.get(key):
+                    self._scan(node[key])
+            for expr in node.get("group_expressions", []):
+                self._scan(expr)
+            for modifier in node.get("modifiers", []):
+                for _, expr, _ in _sub_expressions(modifier):
+                    self._scan(expr, order_scope=True)
+        except _NoMatch:
+            return
+        if not (self.aggregates or node.get("group_expressions")
+                or node.get("aggregate_handling") == "FORCE_AGGREGATES"):
+            return
+
+        fits = [n for n in candidates
+                if self.dims <= set(AGGREGATES[n]["dimensions"])
+                and self.measures <= set(AGGREGATES[n]["measures"])
+                and (not self.uses_month or AGGREGATES[n].get("month") == self.month)]
+        if not fits:
+            return
+        name = min(fits, key=lambda n: self.rows.get(n, 0))
+        self.prefix = [ref.get("alias") or ref["table_name"]]
+
+        originals = copy.deepcopy(node["select_list"])
+        for container_key in ("select_list", "group_expressions"):
+            node[container_key] = [self._apply(e) for e in node.get(container_key, [])]
+        for key in ("where_clause", "having"):
+            if node.get(key):
+                node[key] = self._apply(node[key])
+        for modifier in node.get("modifiers", []):
+            self._apply_within(modifier)
+
+        # Keep the column names the original query would have produced
+        for before, after in zip(originals, node["select_list"]):
+            if not after.get("alias") and before != after:
+                after["alias"] = self._output_name(before)
+
+        ref["table_name"] = name
+        ref["alias"] = self.prefix[0]
+        ref["schema_name"] = ""
+        self.changed = True
+
+    def _column(self, expr: dict):
+        names = expr["column_names"]
+        if len(names) > 2 or (len(names) == 2 and names[0].lower() not in self.qualifiers):
+            raise _NoMatch()
+        return names[-1]
+
+    def _month_argument(self, expr: dict):
+        fname = expr["function_name"].lower()
+        args = expr.get("children", [])
+        if fname in MONTH_FUNCTIONS and len(args) == 1:
+            return 0
+        if fname in PART_FUNCTIONS and len(args) == 2:
+            part = _constant(args[0])
+            if isinstance(part, str) and part.lower() in MONTH_PARTS:
+                return 1
+        if fname == "strftime" and len(args) == 2:
+            for i, fmt in ((0, 1), (1, 0)):
+                if args[i].get("class") == "COLUMN_REF" and _month_format(_constant(args[fmt])):
+                    return i
+        return None
+
+    def _is_month_column(self, expr: dict) -> bool:
+        return (expr.get("class") == "COLUMN_REF" and self.month is not None
+                and expr["column_names"][-1].lower() == self.month.lower())
+
+    # Collect what a block needs from a rollup; raises _NoMatch if it cannot be answered
+    def _scan(self, expr: dict, in_aggregate: bool = False, order_scope: bool = False):
+        kind = expr.get("class")
+        if kind in ("WINDOW", "SUBQUERY", "STAR", "LAMBDA", "PARAMETER", "LAMBDA_REF"):
+            raise _NoMatch()
+        if kind == "COLUMN_REF":
+            name = self._column(expr).lower()
+            if len(expr["column_names"]) == 1 and name in self.aliases and (order_scope or name not in self.columns):
+                return
+            if name not in self.columns:
+                raise _NoMatch()
+            self.dims.add(self.columns[name])
+            return
+        if kind == "FUNCTION":
+            fname = expr["function_name"].lower()
+            if fname in self.agg_functions:
+                self._scan_aggregate(expr, in_aggregate)
+                return
+            index = self._month_argument(expr)
+            if index is not None and self._is_month_column(expr["children"][index]):
+                self._column(expr["children"][index])
+                self.uses_month = True
+                for i, child in enumerate(expr["children"]):
+                    if i != index:
+                        self._scan(child, in_aggregate, order_scope)
+                return
+        for _, child, _ in _sub_expressions(expr):
+            self._scan(child, in_aggregate, order_scope)
+
+    def _scan_aggregate(self, expr: dict, in_aggregate: bool):
+        fname = expr["function_name"].lower()
+        fname = "avg" if fname == "mean" else fname
+        if in_aggregate or (expr.get("order_bys") or {}).get("orders"):
+            raise _NoMatch()
+        self.aggregates = True
+        if expr.get("filter"):
+            self._scan(expr["filter"])
+        if fname == "count_star":
+            return
+        args = expr.get("children", [])
+        if fname not in TEMPLATES or len(args) != 1 or args[0].get("class") != "COLUMN_REF":
+            raise _NoMatch()
+        name = self._column(args[0]).lower()
+        column = self.columns.get(name)
+        if column is None:
+            raise _NoMatch()
+        if expr.get("distinct"):
+            if fname not in ("count", "min", "max") or not self._is_dimension(column):
+                raise _NoMatch()
+            self.dims.add(column)
+        elif self._is_measure(column):
+            self.measures.add(column)
+        elif fname in ("min", "max") and self._is_dimension(column):
+            self.dims.add(column)
+        else:
+            raise _NoMatch()
+
+    def _is_measure(self, column: str) -> bool:
+        return any(column in AGGREGATES[n]["measures"] for n in self.candidates)
+
+    def _is_dimension(self, column: str) -> bool:
+        return any(column in AGGREGATES[n]["dimensions"] for n in self.candidates)
+
+    # Rewrite one expression of a matched block against the chosen rollup
+    def _apply(self, expr: dict) -> dict:
+        if expr.get("class") == "FUNCTION":
+            fname = expr["function_name"].lower()
+            if fname in self.agg_functions:
+                return self._apply_aggregate(expr)
+            index = self._month_argument(expr)
+            if index is not None and self._is_month_column(expr["children"][index]):
+                child = expr["children"][index]
+                child["column_names"] = child["column_names"][:-1] + [f"{self.month}_MONTH"]
+                return expr
+        self._apply_within(expr)
+        return expr
+
+    def _apply_within(self, value):
+        for key, child, container in list(_sub_expressions(value)):
+            container[key] = self._apply(child)
+
+    def _apply_aggregate(self, expr: dict) -> dict:
+        fname = expr["function_name"].lower()
+        fname = "avg" if fname == "mean" else fname
+        args = expr.get("children", [])
+        if fname != "count_star":
+            column = self.columns[self._column(args[0]).lower()]
+            if expr.get("distinct") or not self._is_measure(column):
+                if expr.get("filter"):
+                    expr["filter"] = self._apply(expr["filter"])
+                return expr
+        if fname == "count_star":
+            columns = {"__m__": ROW_COUNT}
+        elif fname == "avg":
+            columns = {"__m__": f"{column}_SUM", "__n__": f"{column}_COUNT"}
+        else:
+            columns = {"__m__": column + ROLLUP_SUFFIX[fname]}
+        replacement = self._template(TEMPLATES[fname], columns)
+        replacement["alias"] = expr.get("alias", "")
+        if expr.get("filter"):
+            condition = self._apply(expr["filter"])
+            for _, child, _ in _descendants({"expr": replacement}):
+                if child.get("class") == "FUNCTION" and child["function_name"] in ("sum", "min", "max"):
+                    child["filter"] = copy.deepcopy(condition)
+        return replacement
+
+    def _template(self, text: str, columns: dict) -> dict:
+        expr = copy.deepcopy(_parse_expression(self.cur, text))
+        for _, child, _ in _descendants({"expr": expr}):
+            if child.get("class") == "COLUMN_REF" and child["column_names"][-1] in columns:
+                child["column_names"] = self.prefix + [columns[child["column_names"][-1]]]
+        return expr
+
+    # DuckDB names an unaliased column after its expression (or the bare column name)
+    def _output_name(self, expr: dict) -> str:
+        if expr.get("class") == "COLUMN_REF":
+            return expr["column_names"][-1]
+        tree = json.loads(self.cur.execute("SELECT json_serialize_sql('SELECT 1')").fetchone()[0])
+        tree["statements"][0]["node"]["select_list"] = [dict(expr, alias="")]
+        text = self.cur.execute("SELECT json_deserialize_sql(?::JSON)", [json.dumps(tree)]).fetchone()[0]
+        return text[len("SELECT "):]
+
+
+_expressions = {}
+
+
+def _parse_expression(cur, text: str) -> dict:
+    if text not in _expressions:
+        tree = json.loads(cur.execute("SELECT json_serialize_sql(?::VARCHAR)", [f"SELECT {text}"]).fetchone()[0])
+        _expressions[text] = tree["statements"][0]["node"]["select_list"][0]
+    return _expressions[text]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+# Rollup store bound to the process-wide engine
+def get_aggregate_store() -> AggregateStore:
+    global _store
+    engine = get_engine()
+    if _store is None or _store.engine is not engine:
+        with _store_lock:
+            if _store is None or _store.engine is not engine:
+                _store = AggregateStore(engine)
+    return _store
+
+
+# Entry point for callers: `sql`, routed to the rollups where possible
+# (with match=False, only the rollups it names are refreshed)
+def rewrite_sql(sql: str, match: bool = True) -> str:
+    if not ENABLED:
+        return sql
+    return get_aggregate_store().rewrite(sql, match)
+
+
+if __name__ == "__main__":
+    store = get_aggregate_store()
+    store.refresh()
+    for name, entry in sorted(store._manifest.items()):
+        print(f"{name:<24} {entry.get('rows', 0):>10} rows  {len(entry['partials'])} partial(s)")
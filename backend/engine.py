@@ -0,0 +1,323 @@
+# backend/engine.py
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import duckdb
+import pyarrow as pa
+
+from backend import ingest
+from observability import metrics
+
+# pandas is the slowest import here and only needed to build DataFrames
+if TYPE_CHECKING:
+    import pandas as pd
+
+DATA_DIR = ingest.DATA_DIR
+
+# Pool controls, overridable from the environment
+POOL_SIZE = int(os.getenv("QUERY_ENGINE_POOL_SIZE", "4"))
+WARMUP = os.getenv("QUERY_ENGINE_WARMUP", "1") not in ("0", "false", "False")
+# "parquet" serves tables from the typed columnar store, "csv" reads the raw files
+SOURCE = os.getenv("QUERY_ENGINE_SOURCE", "parquet")
+# Runaway-query protection: per-query wall clock (0 disables) and DuckDB resource settings
+QUERY_TIMEOUT = float(os.getenv("QUERY_TIMEOUT", "120"))
+MEMORY_LIMIT = os.getenv("QUERY_MEMORY_LIMIT")  # e.g. "4GB"
+THREADS = os.getenv("QUERY_THREADS")
+
+
+class QueryTimeoutError(TimeoutError):
+    pass
+
+
+# Interrupt whatever `cur` is running once `timeout` seconds have passed
+@contextmanager
+def interrupt_after(cur, timeout: float):
+    if not timeout:
+        yield
+        return
+    state = {"done": False, "fired": False}
+    lock = threading.Lock()
+
+    def fire():
+        with lock:
+            if not state["done"]:
+                state["fired"] = True
+                cur.interrupt()
+
+    timer = threading.Timer(timeout, fire)
+    timer.daemon = True
+    timer.start()
+    try:
+        yield
+    except duckdb.InterruptException:
+        if state["fired"]:
+            raise QueryTimeoutError(f"Query exceeded {timeout:g}s and was interrupted") from None
+        raise
+    finally:
+        with lock:
+            state["done"] = True
+        timer.cancel()
+
+
+# Long-lived DuckDB database shared by all callers.
+# Tables are registered once on the root connection; callers borrow
+# per-thread cursors (DuckDB connections to the same database) from a pool.
+class QueryEngine:
+    def __init__(self, data_dir: Path = DATA_DIR, pool_size: int = POOL_SIZE,
+                 source: str = SOURCE, store_dir: Path = ingest.STORE_DIR):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        if source not in ("parquet", "csv"):
+            raise ValueError(f"Unknown table source: {source!r}")
+        self.data_dir = Path(data_dir)
+        self.store_dir = Path(store_dir)
+        self.pool_size = pool_size
+        self.source = source
+        with metrics.span("engine_connect"):
+            self._con = duckdb.connect(database=":memory:")
+        if MEMORY_LIMIT:
+            self._con.execute(f"SET GLOBAL memory_limit = '{MEMORY_LIMIT}'")
+        if THREADS:
+            self._con.execute(f"SET GLOBAL threads = {int(THREADS)}")
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._views = {}
+        self._active = {}  # thread id -> cursors it has borrowed
+        # thread id -> whether an interrupt is pending, for threads in interruptible()
+        self._interruptible = {}
+        self._interrupt_lock = threading.Lock()
+        self._sources = {}  # table -> source file versions the views were built from
+        self._upsert_keys = {}  # table -> primary key its view applies across raw delta CSVs
+
+        self._register_tables()
+        for _ in range(pool_size):
+            self._pool.put(self._new_cursor())
+
+    # Pooled cursors track progress so long queries can report how far along they are
+    def _new_cursor(self):
+        cur = self._con.cursor()
+        cur.execute("SET enable_progress_bar = true")
+        cur.execute("SET enable_progress_bar_print = false")
+        cur.execute("SET progress_bar_time = 0")
+        return cur
+
+    # Register one view per table, named after the file stem (claims.csv → claims)
+    # or the delta directory (claims/*.csv → claims)
+    def _register_tables(self):
+        # Taken before syncing, so data landing meanwhile triggers another refresh
+        sources = {table: self._source_version(table) for table in ingest.discover_tables(self.data_dir)}
+        if self.source == "parquet":
+            with metrics.span("store_sync"):
+                files = ingest.sync_store(self.data_dir, self.store_dir)
+        else:
+            files, meta = {}, ingest.load_table_meta()
+            for table in sources:
+                paths = ingest.source_files(self.data_dir, table)
+                files[table] = paths if ingest.is_partitioned(self.data_dir, table) else paths[0]
+        # Raw deltas are upserted by key when read, as the store does on ingest
+        upsert_keys = {} if self.source == "parquet" else {
+            table: meta[table]["primary_key"] for table, path in files.items()
+            if isinstance(path, list) and meta.get(table, {}).get("primary_key")}
+
+        with self._lock, metrics.span("view_registration", source=self.source):
+            for view_name in set(self._views) - set(files):
+                self._con.execute(f"DROP VIEW IF EXISTS {view_name}")
+            for view_name, path in files.items():
+                self._con.execute(f"""
+                    CREATE OR REPLACE VIEW {view_name} AS
+                    SELECT * FROM {_scan(path, upsert_keys.get(view_name))}
+                """)
+            self._views = dict(files)
+            self._upsert_keys = upsert_keys
+            self._sources = {table: sources.get(table) for table in files}
+
+    # Change marker of the CSV (or delta directory) a table comes from
+    def _source_version(self, table: str) -> tuple:
+        return ingest.source_version(self.data_dir, table)
+
+    # Current version of each table's source data. If a source changed since
+    # the views were built, the store is re-synced first so results match.
+    def data_versions(self, tables=None) -> dict:
+        tables = self.tables if tables is None else tables
+        versions = {table: self._source_version(table) for table in tables}
+        if any(self._sources.get(t) != v for t, v in versions.items()):
+            self.refresh()
+        return versions
+
+    # Re-ingest changed CSVs and repoint the views; safe while queries run
+    def refresh(self):
+        metrics.incr("engine_refreshes")
+        self._register_tables()
+
+    @property
+    def tables(self) -> list:
+        return sorted(self._views)
+
+    # Whether a table's view resolves rows across its files (raw delta CSVs
+    # with a primary key), so no file can be read on its own
+    def is_upserted(self, table: str) -> bool:
+        return table in self._upsert_keys
+
+    # Files backing a table's view
+    def table_files(self, table: str) -> list:
+        path = self._views[table]
+        return list(path) if isinstance(path, list) else [path]
+
+    # Touch every registered table once so file metadata and the CSV sniffer
+    # results are hot before the first real query
+    def warmup(self):
+        with self.cursor() as cur:
+            for table in self.tables:
+                cur.execute(f"SELECT * FROM {table} LIMIT 0").fetchall()
+
+    # Borrow a cursor from the pool; blocks until one is free
+    @contextmanager
+    def cursor(self, timeout: float = None):
+        if self._closed:
+            raise RuntimeError("QueryEngine is closed")
+        try:
+            with metrics.span("cursor_wait"):
+                cur = self._pool.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No free DuckDB cursor after {timeout}s") from None
+        thread_id = threading.get_ident()
+        with self._interrupt_lock:
+            active = self._active.setdefault(thread_id, [])
+            active.append(cur)
+            pending = self._interruptible.get(thread_id, False)
+        try:
+            if pending:
+                raise duckdb.InterruptException("INTERRUPT Error: Interrupted!")
+            yield cur
+        finally:
+            with self._interrupt_lock:
+                active.remove(cur)
+                if not active:
+                    self._active.pop(thread_id, None)
+            self._pool.put(cur)
+
+    # Treat the calling thread's work in this block as one unit: an interrupt
+    # that arrives while it holds no cursor (planning, a store re-sync, a
+    # cache lookup) is kept and raised when it borrows its next cursor
+    @contextmanager
+    def interruptible(self):
+        thread_id = threading.get_ident()
+        with self._interrupt_lock:
+            self._interruptible[thread_id] = False
+        try:
+            yield
+        finally:
+            with self._interrupt_lock:
+                self._interruptible.pop(thread_id, None)
+
+    # Interrupt whatever the given thread is running on its borrowed cursors,
+    # or, inside interruptible(), whatever it runs next
+    def interrupt_thread(self, thread_id: int) -> bool:
+        with self._interrupt_lock:
+            cursors = list(self._active.get(thread_id, ()))
+            pending = thread_id in self._interruptible
+            if pending:
+                self._interruptible[thread_id] = True
+        for cur in cursors:
+            cur.interrupt()
+        return bool(cursors) or pending
+
+    # Percent done (0-100) of what the given thread is running, or None when
+    # it is idle or DuckDB has no estimate yet
+    def thread_progress(self, thread_id: int):
+        estimates = [cur.query_progress() for cur in list(self._active.get(thread_id, ()))]
+        estimates = [p for p in estimates if p >= 0]
+        return max(estimates) if estimates else None
+
+    def execute(self, sql: str, params=None, timeout: float = QUERY_TIMEOUT) -> "pd.DataFrame":
+        with self.cursor() as cur, interrupt_after(cur, timeout):
+            with metrics.span("query_execute"):
+                result = cur.execute(sql, params)
+            with metrics.span("query_fetch", format="pandas"):
+                return result.fetchdf()
+
+    def execute_arrow(self, sql: str, params=None, timeout: float = QUERY_TIMEOUT) -> pa.Table:
+        with self.cursor() as cur, interrupt_after(cur, timeout):
+            with metrics.span("query_execute"):
+                result = cur.execute(sql, params)
+            with metrics.span("query_fetch", format="arrow"):
+                return fetch_arrow(result)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            while not self._pool.empty():
+                self._pool.get_nowait().close()
+            self._con.close()
+
+
+# FROM clause for a table stored as one file or as a list of partition files.
+# With a key, raw delta CSVs are upserted: of the rows sharing a key, the one
+# from the latest file (the last one within that file) wins.
+def _scan(path, key: str = None) -> str:
+    if not isinstance(path, list):
+        return f"'{path.as_posix()}'"
+    files = ", ".join(f"'{p.as_posix()}'" for p in path)
+    reader = "read_csv" if path and path[0].suffix == ".csv" else "read_parquet"
+    options = ", union_by_name = true" if reader == "read_csv" else ""
+    if reader != "read_csv" or not key:
+        return f"{reader}([{files}]{options})"
+    return f"""(
+        SELECT * EXCLUDE (filename, __file, __row) FROM (
+            SELECT *, list_position([{files}], filename) AS __file, row_number() OVER () AS __row
+            FROM read_csv([{files}], union_by_name = true, filename = true)
+        )
+        QUALIFY {key} IS NULL OR row_number() OVER (PARTITION BY {key} ORDER BY __file DESC, __row DESC) = 1
+    )"""
+
+
+# Arrow result of an executed cursor (to_arrow_table replaced fetch_arrow_table)
+def fetch_arrow(cur) -> pa.Table:
+    fetch = getattr(cur, "to_arrow_table", None) or cur.fetch_arrow_table
+    return fetch()
+
+
+# Arrow → pandas with the same dtypes fetchdf() produces (DECIMAL as float64)
+def arrow_to_pandas(table: pa.Table) -> "pd.DataFrame":
+    fields = [
+        pa.field(f.name, pa.float64()) if pa.types.is_decimal(f.type) else f
+        for f in table.schema
+    ]
+    return table.cast(pa.schema(fields)).to_pandas()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+# Process-wide engine, created on first use
+def get_engine() -> QueryEngine:
+    global _engine
+    if _engine is None:
+        with _engine_lock, metrics.span("engine_start"):
+            if _engine is None:
+                engine = QueryEngine()
+                if WARMUP:
+                    engine.warmup()
+                _engine = engine
+    return _engine
+
+
+# Replace the process-wide engine, e.g. to change the pool size at runtime
+def configure_engine(pool_size: int = POOL_SIZE, warmup: bool = WARMUP) -> QueryEngine:
+    global _engine
+    with _engine_lock:
+        old = _engine
+        _engine = QueryEngine(pool_size=pool_size)
+        if warmup:
+            _engine.warmup()
+    if old is not None:
+        old.close()
+    return _engine
@@ -0,0 +1,142 @@
+# backend/guard.py
+import json
+import os
+from dataclasses import dataclass, field
+
+import sqlparse
+from sqlparse import tokens as T
+
+from backend.aggregates import rewrite_sql
+from backend.engine import get_engine
+from backend.result_cache import referenced_tables
+from backend.results import MAX_RESULT_ROWS, strip_sql
+from observability import metrics
+
+# Intermediate rows (largest operator estimate) above which a query needs confirmation
+CONFIRM_ROWS = int(os.getenv("GUARD_CONFIRM_ROWS", str(50_000_000)))
+# ... and above which it is refused outright
+REJECT_ROWS = int(os.getenv("GUARD_REJECT_ROWS", str(2_000_000_000)))
+# Result rows above which a LIMIT is injected
+MAX_OUTPUT_ROWS = int(os.getenv("GUARD_MAX_OUTPUT_ROWS", str(MAX_RESULT_ROWS)))
+# Let oversized exploratory (non-aggregating) queries run on table samples
+ALLOW_SAMPLING = os.getenv("GUARD_ALLOW_SAMPLING", "1") not in ("0", "false", "False")
+
+# Operators whose output is every pair of input rows
+PAIRWISE_JOINS = {"CROSS_PRODUCT", "NESTED_LOOP_JOIN", "BLOCKWISE_NL_JOIN"}
+
+
+class QueryRejected(Exception):
+    pass
+
+
+@dataclass
+class GuardDecision:
+    sql: str  # what to actually execute
+    action: str  # "run", "limit", "sample" or "confirm"
+    estimated_rows: int  # estimated result rows
+    estimated_work: int  # largest estimated intermediate result
+    reason: str = ""
+    sampled_tables: dict = field(default_factory=dict)  # table -> percent kept
+
+
+# Walk the EXPLAIN tree bottom-up. Returns (output rows, largest operator rows,
+# whether anything aggregates).
+def _estimate(node: dict):
+    children = [_estimate(child) for child in node.get("children", [])]
+    info = node.get("extra_info") or {}
+    estimate = info.get("Estimated Cardinality")
+    if estimate is not None:
+        rows = int(estimate)
+    elif node["name"] in PAIRWISE_JOINS and children:
+        rows = 1
+        for child_rows, *_ in children:
+            rows *= max(child_rows, 1)
+    else:
+        rows = max((c[0] for c in children), default=0)
+
+    work = max([rows] + [c[1] for c in children])
+    name = node["name"]
+    aggregates = ("GROUP_BY" in name or "AGGREGATE" in name or "WINDOW" in name
+                  or any(c[2] for c in children))
+    return rows, work, aggregates
+
+
+def explain(sql: str) -> dict:
+    with get_engine().cursor() as cur, metrics.span("explain"):
+        plan = json.loads(cur.execute(f"EXPLAIN (FORMAT JSON) {sql}").fetchall()[0][1])
+    rows, work, aggregates = 0, 0, False
+    for root in plan:
+        r, w, a = _estimate(root)
+        rows, work, aggregates = max(rows, r), max(work, w), aggregates or a
+    return {"rows": rows, "work": work, "aggregates": aggregates}
+
+
+# LIMIT n on the outermost query, if any
+def top_level_limit(sql: str):
+    statement = sqlparse.parse(sql)[0]
+    tokens = [t for t in statement.tokens if not t.is_whitespace]
+    for i, token in enumerate(tokens[:-1]):
+        if token.ttype in T.Keyword and token.normalized == "LIMIT":
+            value = tokens[i + 1].value.split(",")[0].strip()
+            if value.isdigit():
+                return int(value)
+    return None
+
+
+def with_limit(sql: str, limit: int) -> str:
+    return f"SELECT * FROM (\n{sql}\n) AS guarded LIMIT {limit}"
+
+
+# Shadow each table with a Bernoulli sample of itself via a leading CTE, so
+# the query text itself is untouched
+def with_samples(sql: str, percents: dict) -> str:
+    ctes = ", ".join(
+        f"{table} AS (SELECT * FROM main.{table} USING SAMPLE {pct:g} PERCENT (bernoulli))"
+        for table, pct in percents.items()
+    )
+    head = sql.lstrip()
+    if head[:4].upper() == "WITH":
+        rest = head[4:].lstrip()
+        if rest[:9].upper() == "RECURSIVE":
+            return f"WITH RECURSIVE {ctes}, {rest[9:].lstrip()}"
+        return f"WITH {ctes}, {rest}"
+    return f"WITH {ctes} {head}"
+
+
+# Inspect a query before it runs and decide how (or whether) to execute it.
+# Raises QueryRejected for queries that are too expensive to run at all and
+# lets DuckDB's parser/binder errors propagate.
+def check_query(sql: str, confirm_rows: int = CONFIRM_ROWS, reject_rows: int = REJECT_ROWS,
+                max_output_rows: int = MAX_OUTPUT_ROWS, allow_sampling: bool = ALLOW_SAMPLING) -> GuardDecision:
+    sql = strip_sql(sql)
+    # Cost what will actually run: matching aggregates read the rollups
+    plan = explain(rewrite_sql(sql))
+    rows, work = plan["rows"], plan["work"]
+    limit = top_level_limit(sql)
+    if limit is not None:
+        rows = min(rows, limit)
+
+    if work > confirm_rows:
+        tables = sorted(referenced_tables(sql, get_engine().tables))
+        if allow_sampling and not plan["aggregates"] and tables:
+            # Sample each table so the pairwise blow-up lands near the budget
+            pct = max(0.01, min(100.0, 100.0 * (confirm_rows / work) ** (1.0 / len(tables))))
+            percents = {table: round(pct, 2) for table in tables}
+            sampled = with_samples(sql, percents)
+            if limit is None:
+                sampled = with_limit(sampled, max_output_rows)
+            return GuardDecision(sampled, "sample", min(rows, max_output_rows), work,
+                                 f"Estimated {work:,} intermediate rows; running on a {pct:.2g}% sample",
+                                 percents)
+        if work > reject_rows:
+            raise QueryRejected(
+                f"Query rejected: an estimated {work:,} intermediate rows exceeds the limit of {reject_rows:,}"
+            )
+        return GuardDecision(sql, "confirm", rows, work,
+                             f"This query is expensive (an estimated {work:,} intermediate rows)")
+
+    if rows > max_output_rows and limit is None:
+        return GuardDecision(with_limit(sql, max_output_rows), "limit", max_output_rows, work,
+                             f"Result capped at {max_output_rows:,} of an estimated {rows:,} rows")
+
+    return GuardDecision(sql, "run", rows, work)
@@ -0,0 +1,366 @@
+# backend/ingest.py
+import hashlib
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import duckdb
+
+try:
+    import fcntl
+except ImportError:  # Windows: store writers in different processes are not coordinated
+    fcntl = None
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = Path(os.getenv("QUERY_DATA_DIR", ROOT_DIR / "data"))
+SCHEMA_PATH = ROOT_DIR / "schema" / "db_schema.json"
+STORE_DIR = Path(os.getenv("COLUMNAR_STORE_DIR", ROOT_DIR / "store"))
+MANIFEST_NAME = "_manifest.json"
+# Partitioned tables are laid out as <store>/<table>/<YYYY-MM>/*.parquet
+PARTITION_FORMAT = "%Y-%m"
+# A partition with this many files is compacted into one on the next append
+MAX_PARTITION_FILES = int(os.getenv("PARTITION_MAX_FILES", "32"))
+
+_sync_lock = threading.Lock()
+
+
+# Serialize writers of the store across threads and processes (every query
+# worker process syncs the store when it starts)
+@contextmanager
+def store_lock(store_dir: Path = STORE_DIR):
+    with _sync_lock:
+        if fcntl is None:
+            yield
+            return
+        Path(store_dir).mkdir(parents=True, exist_ok=True)
+        with open(Path(store_dir) / ".lock", "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def load_table_meta(schema_path: Path = SCHEMA_PATH) -> dict:
+    if not Path(schema_path).exists():
+        return {}
+    with open(schema_path, "r") as f:
+        return json.load(f)
+
+
+# Column types per table, as declared under "types" in db_schema.json
+def load_column_types(schema_path: Path = SCHEMA_PATH) -> dict:
+    return {table: meta.get("types", {}) for table, meta in load_table_meta(schema_path).items()}
+
+
+# A table is partitioned when its data arrives as delta files in
+# data/<table>/*.csv. A data/<table>.csv next to the directory is ingested
+# first, as the initial load.
+def source_files(data_dir: Path, table: str) -> list:
+    data_dir = Path(data_dir)
+    flat = data_dir / f"{table}.csv"
+    files = [flat] if flat.exists() else []
+    return files + sorted((data_dir / table).glob("*.csv"))
+
+
+def is_partitioned(data_dir: Path, table: str) -> bool:
+    return (Path(data_dir) / table).is_dir()
+
+
+def discover_tables(data_dir: Path) -> list:
+    data_dir = Path(data_dir)
+    tables = {path.stem for path in data_dir.glob("*.csv")}
+    tables |= {path.name for path in data_dir.iterdir() if path.is_dir() and any(path.glob("*.csv"))}
+    return sorted(tables)
+
+
+# Cheap change marker for a table's sources: the flat CSV's (mtime, size) and
+# the delta directory's mtime, which moves whenever a file lands in it.
+# Delta files are expected to be written elsewhere and renamed into place.
+def source_version(data_dir: Path, table: str):
+    version = []
+    for path in (Path(data_dir) / f"{table}.csv", Path(data_dir) / table):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            version.append(None)
+            continue
+        version.append((stat.st_mtime_ns, None if path.is_dir() else stat.st_size))
+    return None if version == [None, None] else tuple(version)
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(store_dir: Path = STORE_DIR) -> dict:
+    path = Path(store_dir) / MANIFEST_NAME
+    if not path.exists():
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _write_manifest(store_dir: Path, manifest: dict):
+    path = Path(store_dir) / MANIFEST_NAME
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# Quote a DuckDB string literal
+def _lit(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _csv_source(csv_path: Path, types: dict = None) -> str:
+    source = f"read_csv({_lit(csv_path.as_posix())}, header = true"
+    if types:
+        type_map = ", ".join(f"{_lit(col)}: {_lit(t)}" for col, t in types.items())
+        source += f", types = {{{type_map}}}"
+    return source + ")"
+
+
+def _copy_to_parquet(con, query: str, parquet_path: Path):
+    parquet_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = parquet_path.with_suffix(".parquet.tmp")
+    con.execute(f"COPY ({query}) TO {_lit(tmp.as_posix())} (FORMAT parquet, COMPRESSION zstd)")
+    os.replace(tmp, parquet_path)
+
+
+# Convert one CSV into a zstd-compressed Parquet file with the declared types.
+# Written to a temp file first so readers never see a half-written table.
+def convert_csv(csv_path: Path, parquet_path: Path, types: dict = None) -> int:
+    parquet_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = parquet_path.with_suffix(".parquet.tmp")
+    source = _csv_source(csv_path, types)
+
+    con = duckdb.connect(database=":memory:")
+    try:
+        # COPY reports the rows it wrote, so the CSV is read only once
+        rows = con.execute(f"""
+            COPY (SELECT * FROM {source})
+            TO {_lit(tmp.as_posix())} (FORMAT parquet, COMPRESSION zstd)
+        """).fetchone()[0]
+    finally:
+        con.close()
+    os.replace(tmp, parquet_path)
+    return rows
+
+
+# Apply one delta file to a partitioned table. Rows are bucketed by the month
+# of the partition column; in each touched partition the delta is appended
+# as a new file. A partition holding rows the delta replaces (same primary
+# key, in any partition: an update may move a row to another month) is
+# rewritten without them instead. Replaced files are not deleted yet: views
+# may still read them until the engine re-registers.
+# Returns the change in row count, counted from the files before and after.
+def _apply_delta(con, csv_path: Path, table_dir: Path, entry: dict, types: dict) -> int:
+    key, partition_by = entry.get("primary_key"), entry.get("partition_by")
+    part = (f"coalesce(strftime({partition_by}, '{PARTITION_FORMAT}'), 'unknown')"
+            if partition_by else "'all'")
+    # The last row for a key within one file wins; rows without a key are all kept
+    dedup = (f"QUALIFY {key} IS NULL OR row_number() OVER (PARTITION BY {key} ORDER BY __row DESC) = 1"
+             if key else "")
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE delta AS
+        SELECT * EXCLUDE (__row), {part} AS __partition
+        FROM (SELECT *, row_number() OVER () AS __row FROM {_csv_source(csv_path, types)})
+        {dedup}
+    """)
+
+    def file_list(partition: str) -> str:
+        return "[" + ", ".join(_lit((table_dir / f).as_posix()) for f in entry["partitions"][partition]) + "]"
+
+    def row_count(files: str) -> int:
+        return con.execute(f"SELECT count(*) FROM read_parquet({files})").fetchone()[0]
+
+    targets = [value for (value,) in con.execute("SELECT DISTINCT __partition FROM delta ORDER BY 1").fetchall()]
+    # Live partitions holding any of the delta's keys; only the key column is read
+    replacing = set()
+    keys = f"SELECT {key} FROM delta WHERE {key} IS NOT NULL"
+    live = {f"{table_dir.name}/{f}": value for value, files in entry["partitions"].items() for f in files}
+    if key and live:
+        all_files = "[" + ", ".join(_lit((table_dir.parent / f).as_posix()) for f in live) + "]"
+        found = con.execute(f"""
+            SELECT DISTINCT filename FROM read_parquet({all_files}, filename = true)
+            WHERE {key} IN ({keys})
+        """).fetchall()
+        by_path = {(table_dir.parent / f).as_posix(): value for f, value in live.items()}
+        replacing = {by_path[path] for (path,) in found}
+
+    added = 0
+    for value in sorted(set(targets) | replacing):
+        existing = entry["partitions"].get(value, [])
+        before = row_count(file_list(value)) if existing else 0
+        rows = f"SELECT * EXCLUDE (__partition) FROM delta WHERE __partition = {_lit(value)}"
+
+        entry["seq"] = entry.get("seq", 0) + 1
+        name = f"{value}/part-{entry['seq']:06d}.parquet"
+        if value in replacing or len(existing) >= MAX_PARTITION_FILES:
+            kept = f"SELECT * FROM read_parquet({file_list(value)})"
+            if value in replacing:
+                # NOT IN alone is NULL, not true, for rows without a key
+                kept += f" WHERE {key} IS NULL OR {key} NOT IN ({keys})"
+            query = f"{kept} UNION ALL BY NAME {rows}" if value in targets else kept
+            _copy_to_parquet(con, query, table_dir / name)
+            entry["obsolete"] += [f"{table_dir.name}/{f}" for f in existing]
+            entry["partitions"][value] = [name]
+        else:
+            _copy_to_parquet(con, rows, table_dir / name)
+            entry["partitions"][value] = existing + [name]
+
+        after = row_count(file_list(value))
+        if not after:
+            # Every row moved elsewhere
+            entry["obsolete"] += [f"{table_dir.name}/{f}" for f in entry["partitions"].pop(value)]
+        added += after - before
+    con.execute("DROP TABLE delta")
+    return added
+
+
+# Bring a partitioned table in line with its delta files. Only files not in
+# the manifest are read, so the cost follows the size of the new data, not
+# of the history. A delta that was modified or removed after ingestion
+# invalidates the history and the table is rebuilt from its files.
+def _sync_partitioned(data_dir: Path, store_dir: Path, table: str, entry: dict, meta: dict) -> dict:
+    table_dir = store_dir / table
+    if not entry or entry.get("mode") != "partitioned":
+        obsolete = [entry["parquet"]] if entry and "parquet" in entry else []
+        entry = {"mode": "partitioned", "files": {}, "partitions": {}, "obsolete": obsolete, "rows": 0}
+    entry.update(primary_key=meta.get("primary_key"), partition_by=meta.get("partition_by"))
+
+    # Files replaced by the previous sync are no longer referenced by any view
+    for name in entry["obsolete"]:
+        (store_dir / name).unlink(missing_ok=True)
+    entry["obsolete"] = []
+
+    current = {path.relative_to(data_dir).as_posix(): path for path in source_files(data_dir, table)}
+    rebuild = False
+    for name, done in entry["files"].items():
+        path = current.get(name)
+        if path is None:
+            rebuild = True
+            break
+        stat = path.stat()
+        if (done["mtime_ns"], done["size"]) != (stat.st_mtime_ns, stat.st_size):
+            if file_sha256(path) != done["sha256"]:
+                rebuild = True
+                break
+            done.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+    if rebuild:
+        entry["obsolete"] = [f"{table}/{f}" for files in entry["partitions"].values() for f in files]
+        entry.update(files={}, partitions={}, rows=0)
+
+    pending = [name for name in current if name not in entry["files"]]
+    if pending:
+        types = meta.get("types", {})
+        con = duckdb.connect(database=":memory:")
+        try:
+            for name in pending:
+                path = current[name]
+                stat = path.stat()
+                entry["rows"] += _apply_delta(con, path, table_dir, entry, types)
+                entry["files"][name] = {
+                    "mtime_ns": stat.st_mtime_ns,
+                    "size": stat.st_size,
+                    "sha256": file_sha256(path),
+                }
+        finally:
+            con.close()
+    return entry
+
+
+# Bring the columnar store in line with data_dir. Only tables whose CSV
+# changed are rebuilt: mtime/size is the cheap check, and the content hash
+# decides whether a touched file actually needs converting again.
+# Partitioned tables (data/<table>/*.csv) only ingest delta files they have
+# not seen before.
+# Returns {table: parquet path, or the list of live files of a partitioned
+# table} for every table in the store.
+def sync_store(data_dir: Path = DATA_DIR, store_dir: Path = STORE_DIR,
+               schema_path: Path = SCHEMA_PATH) -> dict:
+    data_dir, store_dir = Path(data_dir), Path(store_dir)
+    with store_lock(store_dir):
+        store_dir.mkdir(parents=True, exist_ok=True)
+        manifest = load_manifest(store_dir)
+        table_meta = load_table_meta(schema_path)
+        seen = set()
+
+        for table in discover_tables(data_dir):
+            seen.add(table)
+            if is_partitioned(data_dir, table):
+                manifest[table] = _sync_partitioned(data_dir, store_dir, table, manifest.get(table),
+                                                    table_meta.get(table, {}))
+                continue
+
+            csv_path = data_dir / f"{table}.csv"
+            parquet_path = store_dir / f"{table}.parquet"
+            stat = csv_path.stat()
+            entry = manifest.get(table)
+            if entry and entry.get("mode") == "partitioned":
+                shutil.rmtree(store_dir / table, ignore_errors=True)
+                entry = None
+
+            if entry and parquet_path.exists():
+                if entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                    continue
+                sha = file_sha256(csv_path)
+                if entry["sha256"] == sha:
+                    entry.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                    continue
+            else:
+                sha = file_sha256(csv_path)
+
+            rows = convert_csv(csv_path, parquet_path, table_meta.get(table, {}).get("types"))
+            manifest[table] = {
+                "source": csv_path.as_posix(),
+                "parquet": parquet_path.name,
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "sha256": sha,
+                "rows": rows,
+            }
+
+        # Drop tables whose source data disappeared
+        for table in set(manifest) - seen:
+            if manifest[table].get("mode") == "partitioned":
+                shutil.rmtree(store_dir / table, ignore_errors=True)
+            else:
+                (store_dir / manifest[table]["parquet"]).unlink(missing_ok=True)
+            del manifest[table]
+
+        _write_manifest(store_dir, manifest)
+        tables = {}
+        for table, entry in manifest.items():
+            if entry.get("mode") == "partitioned":
+                files = [store_dir / table / f for part in sorted(entry["partitions"])
+                         for f in entry["partitions"][part]]
+                if files:
+                    tables[table] = files
+            else:
+                tables[table] = store_dir / entry["parquet"]
+        return tables
+
+
+if __name__ == "__main__":
+    before = load_manifest()
+    tables = sync_store()
+    after = load_manifest()
+    for table in sorted(tables):
+        entry = after[table]
+        if entry.get("mode") == "partitioned":
+            new = len(set(entry["files"]) - set(before.get(table, {}).get("files", {})))
+            print(f"{table:<12} {entry['rows']:>10} rows  {new} new delta(s)  "
+                  f"{len(entry['partitions'])} partitions")
+            continue
+        status = "unchanged" if before.get(table, {}).get("sha256") == entry["sha256"] else "rebuilt"
+        print(f"{table:<12} {entry['rows']:>10} rows  {status:<9}  {tables[table]}")
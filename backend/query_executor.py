@@ -1,22 +1,44 @@
 # backend/query_executor.py
-import duckdb
-import pandas as pd
-from pathlib import Path
-
-DATA_DIR = Path(__file__).resolve().parent.parent / "data"
-
-def run_sql_query(sql: str) -> pd.DataFrame:
-    con = duckdb.connect(database=":memory:")  # use in-memory DB for speed
-
-    # Register all four CSVs as views
-    for csv_path in DATA_DIR.glob("*.csv"):
-        view_name = csv_path.stem  # e.g., claims.csv → claims
-        con.execute(f"""
-            CREATE OR REPLACE VIEW {view_name} AS
-            SELECT * FROM '{csv_path.as_posix()}'
-        """)
-
-    try:
-        return con.execute(sql).fetchdf()
-    finally:
-        con.close()
+from typing import TYPE_CHECKING
+
+import pyarrow as pa
+
+from backend.aggregates import rewrite_sql, source_tables
+from backend.engine import DATA_DIR, arrow_to_pandas, get_engine
+from backend.result_cache import canonicalize_sql, get_result_cache, is_cacheable, referenced_tables
+from observability import metrics
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Run a query and return the result as an Arrow table
+def run_sql_arrow(sql: str, use_cache: bool = True, use_aggregates: bool = True) -> pa.Table:
+    with metrics.span("run_sql_query"):
+        # Runs on a pooled cursor of the shared engine; tables are registered once
+        engine = get_engine()
+        cacheable = is_cacheable(sql)
+        # Aggregates the rollups can answer are routed to them
+        target = rewrite_sql(sql, match=use_aggregates and cacheable)
+        if not use_cache or not cacheable:
+            metrics.incr("result_cache", result="bypass")
+            return engine.execute_arrow(target)
+
+        # Identical queries over unchanged data are served from the result cache
+        cache = get_result_cache()
+        canonical = canonicalize_sql(sql)
+        # Rollups are as current as the tables they are built from
+        tables = referenced_tables(sql, engine.tables) | (source_tables(sql) & set(engine.tables))
+        versions = engine.data_versions(tables)
+        table = cache.get(canonical, versions)
+        metrics.incr("result_cache", result="miss" if table is None else "hit")
+        if table is None:
+            table = engine.execute_arrow(target)
+            cache.put(canonical, versions, table)
+        return table
+
+
+def run_sql_query(sql: str, use_cache: bool = True, use_aggregates: bool = True) -> "pd.DataFrame":
+    table = run_sql_arrow(sql, use_cache=use_cache, use_aggregates=use_aggregates)
+    with metrics.span("dataframe_conversion"):
+        return arrow_to_pandas(table)
@@ -0,0 +1,83 @@
+# backend/resources.py
+# Named process-wide resources, each built once by its module's get_x()
+# singleton, and a way to warm them in the background at startup. Modules are
+# imported only when their resource is first used, so importing this one is
+# free and warming the engine does not pull in the LLM client.
+import importlib
+import os
+import threading
+import time
+
+from observability import metrics
+
+RESOURCES = {
+    "schema": "llm.text2sql_agent:load_schema",
+    "sql_cache": "llm.sql_cache:get_sql_cache",
+    "repair_cache": "pipeline.repair:get_repair_cache",
+    # Connects, syncs the columnar store and registers the views
+    "engine": "backend.engine:get_engine",
+    "aggregates": "backend.aggregates:get_aggregate_store",
+    "result_cache": "backend.result_cache:get_result_cache",
+    "session_store": "backend.session_store:get_session_store",
+    "query_service": "backend.worker_pool:get_query_service",
+    # Builds the LLM client, or loads and primes a local model
+    "llm": "llm.text2sql_agent:warmup",
+    # Import only; needed to display the first result
+    "pandas": "pandas",
+}
+# What the app warms at startup, in order
+STARTUP = [name for name in os.getenv(
+    "STARTUP_WARM", "schema,sql_cache,engine,aggregates,query_service,llm,pandas").split(",") if name]
+
+
+def register(name: str, target: str):
+    RESOURCES[name] = target
+
+
+# The resource itself; built on the first call, shared afterwards.
+# Targets are "module:function", or just "module" to import it.
+def get(name: str):
+    module, _, attr = RESOURCES[name].partition(":")
+    module = importlib.import_module(module)
+    return getattr(module, attr)() if attr else module
+
+
+# Warms resources one after another and records how each went. A failure is
+# only recorded: the same error surfaces again where the resource is used.
+class Warmup:
+    def __init__(self, names: list):
+        self.names = list(names)
+        self.status = {name: "pending" for name in self.names}
+        self.elapsed = {}
+        self._done = threading.Event()
+
+    def run(self):
+        try:
+            for name in self.names:
+                start = time.perf_counter()
+                try:
+                    with metrics.span("warmup", resource=name):
+                        get(name)
+                    self.status[name] = "ready"
+                except Exception as e:
+                    self.status[name] = f"failed: {type(e).__name__}: {e}"
+                self.elapsed[name] = time.perf_counter() - start
+                metrics.incr("warmups", resource=name, outcome=self.status[name].split(":")[0])
+        finally:
+            self._done.set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+
+def warm(names: list = None, background: bool = True) -> Warmup:
+    warmup = Warmup(STARTUP if names is None else names)
+    if background:
+        threading.Thread(target=warmup.run, daemon=True, name="resource-warmup").start()
+    else:
+        warmup.run()
+    return warmup
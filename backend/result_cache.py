@@ -0,0 +1,158 @@
+# backend/result_cache.py
+import os
+import threading
+from collections import OrderedDict
+
+import pyarrow as pa
+import sqlparse
+from sqlparse import tokens as T
+
+MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Functions whose result changes between executions; queries using them are not cached
+VOLATILE_FUNCTIONS = {
+    "random", "now", "current_timestamp", "current_date", "current_time",
+    "get_current_timestamp", "uuid", "gen_random_uuid", "setseed", "nextval",
+}
+
+
+# Reserved words, which can never be a bare identifier or alias. Only these
+# are upper-cased: sqlparse also lexes names like `year` or `date` as
+# keywords, and DuckDB keeps an alias's case in the result's column names.
+RESERVED_WORDS = {
+    "SELECT", "FROM", "WHERE", "GROUP", "BY", "ORDER", "HAVING", "LIMIT", "OFFSET", "QUALIFY",
+    "AS", "AND", "OR", "NOT", "IN", "IS", "NULL", "TRUE", "FALSE", "ON", "USING", "CASE", "WHEN",
+    "THEN", "ELSE", "END", "DISTINCT", "ALL", "UNION", "INTERSECT", "EXCEPT", "WITH", "ASC", "DESC",
+    "BETWEEN", "LIKE", "ILIKE", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "OUTER", "CROSS", "CAST",
+}
+
+
+# Canonical form of a query: comments stripped, reserved words upper-cased
+# and whitespace collapsed. Identifiers, aliases, quoted names and string
+# literals are kept exactly as written, since they can change the result's
+# column names.
+def canonicalize_sql(sql: str) -> str:
+    parts = []
+    for statement in sqlparse.parse(sqlparse.format(sql, strip_comments=True)):
+        for token in statement.flatten():
+            if token.is_whitespace:
+                if parts and parts[-1] != " ":
+                    parts.append(" ")
+            elif token.ttype in T.Keyword and RESERVED_WORDS.issuperset(token.value.upper().split()):
+                parts.append(" ".join(token.value.upper().split()))  # "group  by" is one token
+            else:
+                parts.append(token.value)
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+# Names in the query that refer to one of the known tables
+def referenced_tables(sql: str, tables) -> set:
+    known = {t.lower(): t for t in tables}
+    names = set()
+    for statement in sqlparse.parse(sql):
+        for token in statement.flatten():
+            if token.ttype in T.Name or token.ttype in T.Keyword:
+                name = token.value.strip('"').lower()
+                if name in known:
+                    names.add(known[name])
+    return names
+
+
+# Only single read-only statements without volatile functions are safe to reuse
+def is_cacheable(sql: str) -> bool:
+    statements = [s for s in sqlparse.parse(sql) if str(s).strip(" ;\n\t")]
+    if len(statements) != 1 or statements[0].get_type() != "SELECT":
+        return False
+    for token in statements[0].flatten():
+        if token.ttype in T.Name or token.ttype in T.Keyword:
+            if token.value.lower() in VOLATILE_FUNCTIONS:
+                return False
+    return True
+
+
+# LRU cache of Arrow result tables bounded by their in-memory size.
+# Keys pair the canonical SQL with the data versions of the tables it reads,
+# so a changed source file can never serve an old result; entries for the
+# old version are dropped as soon as the new version is observed.
+class ResultCache:
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (table, nbytes, tables)
+        self._versions = {}  # table name -> last seen version
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(canonical_sql: str, versions: dict) -> tuple:
+        return canonical_sql, tuple(sorted(versions.items()))
+
+    def _drop(self, key):
+        _, nbytes, _ = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    # Forget everything that was computed from an older version of a table
+    def _observe(self, versions: dict):
+        stale = {t for t, v in versions.items() if self._versions.get(t, v) != v}
+        self._versions.update(versions)
+        if stale:
+            for key in [k for k, (_, _, tables) in self._entries.items() if tables & stale]:
+                self._drop(key)
+
+    def get(self, canonical_sql: str, versions: dict):
+        with self._lock:
+            self._observe(versions)
+            key = self.make_key(canonical_sql, versions)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, canonical_sql: str, versions: dict, table: pa.Table):
+        nbytes = table.nbytes
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._observe(versions)
+            key = self.make_key(canonical_sql, versions)
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (table, nbytes, frozenset(versions))
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
@@ -0,0 +1,138 @@
+# backend/results.py
+import os
+import uuid
+from typing import TYPE_CHECKING
+
+import pyarrow as pa
+import sqlparse
+
+from backend.aggregates import rewrite_sql
+from backend.engine import arrow_to_pandas, get_engine
+from backend.query_executor import run_sql_arrow
+from backend.session_store import get_session_store
+from backend.worker_pool import get_query_service
+from observability import metrics
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Hard cap on rows streamed or materialized from a single result
+MAX_RESULT_ROWS = int(os.getenv("MAX_RESULT_ROWS", "100000"))
+PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "500"))
+BATCH_ROWS = 64 * 1024
+
+
+# A single statement without comments or a trailing semicolon, safe to wrap
+# in a subquery (a trailing "-- comment" would swallow the closing paren)
+def strip_sql(sql: str) -> str:
+    return sqlparse.format(sql, strip_comments=True).strip().rstrip(";").strip()
+
+
+# A query result that is never held in DataFrame form as a whole. The rows
+# (up to max_rows) are fetched once as Arrow and kept in the session store,
+# which bounds and spills them; pages are slices of that one result, so they
+# stay consistent even when the query has no ORDER BY. The full row count is
+# only computed when the result was cut off, and full scans stream Arrow
+# record batches from a pooled cursor.
+# Small enough to keep in session state instead of a DataFrame.
+class ResultHandle:
+    def __init__(self, sql: str, max_rows: int = MAX_RESULT_ROWS, page_size: int = PAGE_SIZE,
+                 session: str = "default"):
+        self.sql = strip_sql(sql)
+        self.max_rows = max_rows
+        self.page_size = page_size
+        self.session = session
+        self.id = uuid.uuid4().hex
+        self._row_count = None
+        self._columns = None
+
+    def __repr__(self):
+        return f"ResultHandle({self.sql[:60]!r})"
+
+    # Page and count queries run on the query service when there is one
+    # (inline otherwise); either way repeats hit the result cache
+    def _query_arrow(self, sql: str) -> pa.Table:
+        service = get_query_service()
+        if service is None:
+            return run_sql_arrow(sql)
+        return service.run(sql, session=self.session)
+
+    def _query(self, sql: str) -> "pd.DataFrame":
+        return arrow_to_pandas(self._query_arrow(sql))
+
+    @property
+    def columns(self) -> list:
+        if self._columns is None:
+            self._columns = self._result().column_names
+        return self._columns
+
+    # Rows in the full result (before max_rows). Known from the result itself
+    # unless it was cut off at max_rows; then counted on first use.
+    def row_count(self) -> int:
+        if self._row_count is None:
+            self._result()
+        if self._row_count is None:
+            self._row_count = int(self._query(f"SELECT count(*) FROM (\n{self.sql}\n) AS q").iloc[0, 0])
+        return self._row_count
+
+    @property
+    def is_truncated(self) -> bool:
+        return self.row_count() > self.max_rows
+
+    def page_count(self) -> int:
+        rows = min(self.row_count(), self.max_rows)
+        return max(1, -(-rows // self.page_size))
+
+    # The query that fetches the result, or only its first `rows` rows: one
+    # row more than that, which tells whether the result was cut off
+    def result_sql(self, rows: int = None) -> str:
+        rows = self.max_rows if rows is None else min(rows, self.max_rows)
+        return f"SELECT * FROM (\n{self.sql}\n) AS q LIMIT {rows + 1}"
+
+    def _result(self) -> pa.Table:
+        table = get_session_store().get_page(self.session, (self.id, "result"))
+        if table is None:
+            table = self.set_result(self._query_arrow(self.result_sql()))
+        return table
+
+    # Keep a result fetched with result_sql(), here or elsewhere (e.g. by a
+    # job the app submitted itself). Returns it capped at max_rows.
+    def set_result(self, table: pa.Table) -> pa.Table:
+        if table.num_rows <= self.max_rows:
+            self._row_count = table.num_rows
+        table = table.slice(0, self.max_rows)
+        get_session_store().put_page(self.session, (self.id, "result"), table)
+        return table
+
+    # One page of rows (0-based), sliced from the result
+    def page(self, number: int, page_size: int = None) -> "pd.DataFrame":
+        size = page_size or self.page_size
+        table = self._result().slice(number * size, size)
+        with metrics.span("dataframe_conversion"):
+            return arrow_to_pandas(table)
+
+    # Stream the result as Arrow record batches, stopping at max_rows.
+    # The cursor goes back to the pool when the generator is exhausted or closed.
+    def iter_batches(self, batch_rows: int = BATCH_ROWS):
+        remaining = self.max_rows
+        sql = rewrite_sql(self.sql)
+        with get_engine().cursor() as cur:
+            reader = cur.execute(sql).fetch_record_batch(batch_rows)
+            try:
+                for batch in reader:
+                    if remaining <= 0:
+                        break
+                    if batch.num_rows > remaining:
+                        batch = batch.slice(0, remaining)
+                    remaining -= batch.num_rows
+                    yield batch
+            finally:
+                reader.close()
+
+    def iter_frames(self, batch_rows: int = BATCH_ROWS):
+        for batch in self.iter_batches(batch_rows):
+            yield arrow_to_pandas(pa.Table.from_batches([batch]))
+
+    # Whole result (up to max_rows) as one DataFrame, in the order the pages show
+    def to_pandas(self) -> "pd.DataFrame":
+        return arrow_to_pandas(self._result())
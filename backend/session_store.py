@@ -0,0 +1,254 @@
+# backend/session_store.py
+# Per-session state kept outside st.session_state so it stays bounded: chat
+# history and cached result pages. Each session has an entry cap and a memory
+# budget, all sessions together have a global one, and idle sessions expire.
+# Over budget, result pages are spilled to Arrow files on local disk first;
+# history is trimmed oldest-first, starting with the least recently active
+# session.
+import atexit
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from pathlib import Path
+
+import pyarrow as pa
+
+from observability import metrics
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SPILL_DIR = Path(os.getenv("SESSION_SPILL_DIR", ROOT_DIR / ".cache" / "sessions"))
+HISTORY_ENTRIES = int(os.getenv("SESSION_HISTORY_ENTRIES", "200"))
+# In-memory bytes (history + result pages) per session and across all sessions
+SESSION_BYTES = int(os.getenv("SESSION_MEMORY_BYTES", str(4 * 1024 * 1024)))
+TOTAL_BYTES = int(os.getenv("SESSION_STORE_MEMORY_BYTES", str(256 * 1024 * 1024)))
+# Result pages kept per session, in memory or spilled
+PAGES_PER_SESSION = int(os.getenv("SESSION_MAX_PAGES", "16"))
+# Sessions not seen for this long are dropped, spilled files included
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(6 * 3600)))
+
+
+class _Page:
+    __slots__ = ("table", "path", "nbytes")
+
+    def __init__(self, table: pa.Table):
+        self.table = table
+        self.path = None
+        self.nbytes = table.nbytes
+
+
+class _Session:
+    __slots__ = ("id", "history", "history_bytes", "pages", "page_bytes", "last_seen")
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.history = deque()  # (timestamp, question, sql)
+        self.history_bytes = 0
+        self.pages = OrderedDict()  # key -> _Page, least recently used first
+        self.page_bytes = 0  # in-memory pages only
+        self.last_seen = time.time()
+
+    @property
+    def nbytes(self) -> int:
+        return self.history_bytes + self.page_bytes
+
+
+def _entry_bytes(question: str, sql: str) -> int:
+    return len(question.encode("utf-8")) + len(sql.encode("utf-8")) + 64
+
+
+class SessionStore:
+    def __init__(self, spill_dir: Path = SPILL_DIR, history_entries: int = HISTORY_ENTRIES,
+                 session_bytes: int = SESSION_BYTES, total_bytes: int = TOTAL_BYTES,
+                 pages_per_session: int = PAGES_PER_SESSION, ttl: float = SESSION_TTL):
+        # Spill files live under a per-process directory so restarts never read stale pages
+        self.spill_dir = Path(spill_dir) / f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.history_entries = history_entries
+        self.session_bytes = session_bytes
+        self.total_bytes = total_bytes
+        self.pages_per_session = pages_per_session
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # least recently active first
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def _session(self, session_id: str) -> _Session:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Session(session_id)
+        session.last_seen = time.time()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    # --------------------------
+    # History
+    # --------------------------
+
+    def add_history(self, session_id: str, question: str, sql: str):
+        question, sql = question or "", sql or ""
+        with self._lock:
+            session = self._session(session_id)
+            session.history.append((time.time(), question, sql))
+            size = _entry_bytes(question, sql)
+            session.history_bytes += size
+            self._bytes += size
+            self._enforce(session)
+
+    # One page of history, newest first, as [{"question", "sql", "ts"}], plus the total
+    def history(self, session_id: str, page: int = 0, page_size: int = 10):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return [], 0
+            entries = list(session.history)
+        total = len(entries)
+        start = max(0, total - (page + 1) * page_size)
+        stop = max(0, total - page * page_size)
+        chunk = reversed(entries[start:stop])
+        return [{"ts": ts, "question": q, "sql": s} for ts, q, s in chunk], total
+
+    def history_count(self, session_id: str) -> int:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return len(session.history) if session is not None else 0
+
+    def _drop_oldest_history(self, session: _Session) -> bool:
+        if not session.history:
+            return False
+        _, question, sql = session.history.popleft()
+        size = _entry_bytes(question, sql)
+        session.history_bytes -= size
+        self._bytes -= size
+        metrics.incr("session_store_evictions", kind="history")
+        return True
+
+    # --------------------------
+    # Result pages
+    # --------------------------
+
+    def put_page(self, session_id: str, key, table: pa.Table):
+        with self._lock:
+            session = self._session(session_id)
+            self._discard_page(session, key)
+            page = session.pages[key] = _Page(table)
+            session.page_bytes += page.nbytes
+            self._bytes += page.nbytes
+            while len(session.pages) > self.pages_per_session:
+                self._discard_page(session, next(iter(session.pages)))
+            self._enforce(session)
+
+    def get_page(self, session_id: str, key):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            page = session.pages.get(key) if session is not None else None
+            if page is None:
+                return None
+            self._session(session_id)
+            session.pages.move_to_end(key)
+            if page.table is not None:
+                return page.table
+            path = page.path
+        try:
+            with pa.memory_map(str(path)) as source:
+                return pa.ipc.open_file(source).read_all()
+        except OSError:
+            return None
+
+    def _discard_page(self, session: _Session, key):
+        page = session.pages.pop(key, None)
+        if page is None:
+            return
+        if page.table is not None:
+            session.page_bytes -= page.nbytes
+            self._bytes -= page.nbytes
+        if page.path is not None:
+            page.path.unlink(missing_ok=True)
+
+    # Move a session's least recently used in-memory page to disk
+    def _spill_one(self, session: _Session) -> bool:
+        for key, page in session.pages.items():
+            if page.table is None:
+                continue
+            directory = self.spill_dir / session.id
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / f"{uuid.uuid4().hex}.arrow"
+            with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, page.table.schema) as writer:
+                writer.write_table(page.table)
+            page.table, page.path = None, path
+            session.page_bytes -= page.nbytes
+            self._bytes -= page.nbytes
+            metrics.incr("session_store_evictions", kind="page_spill")
+            return True
+        return False
+
+    # --------------------------
+    # Budgets
+    # --------------------------
+
+    def _enforce(self, session: _Session):
+        while len(session.history) > self.history_entries:
+            self._drop_oldest_history(session)
+        while session.nbytes > self.session_bytes:
+            if not (self._spill_one(session) or self._drop_oldest_history(session)):
+                break
+        self._expire()
+        # Global budget: spill, then trim history, least recently active sessions first
+        for shrink in (self._spill_one, self._drop_oldest_history):
+            for other in list(self._sessions.values()):
+                while self._bytes > self.total_bytes and shrink(other):
+                    pass
+                if self._bytes <= self.total_bytes:
+                    return
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for session_id, session in list(self._sessions.items()):
+            if session.last_seen >= cutoff:
+                break
+            self._drop(session_id)
+            metrics.incr("session_store_evictions", kind="session")
+
+    def _drop(self, session_id: str):
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return
+        self._bytes -= session.nbytes
+        shutil.rmtree(self.spill_dir / session_id, ignore_errors=True)
+
+    # Forget a session entirely (e.g. "Start New Chat")
+    def drop_session(self, session_id: str):
+        with self._lock:
+            self._drop(session_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pages = [p for s in self._sessions.values() for p in s.pages.values()]
+            return {
+                "sessions": len(self._sessions),
+                "memory_bytes": self._bytes,
+                "history_entries": sum(len(s.history) for s in self._sessions.values()),
+                "pages_in_memory": sum(p.table is not None for p in pages),
+                "pages_spilled": sum(p.path is not None for p in pages),
+            }
+
+    def close(self):
+        with self._lock:
+            self._sessions.clear()
+            self._bytes = 0
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SessionStore()
+                atexit.register(_store.close)
+    return _store
@@ -0,0 +1,86 @@
+# backend/speculation.py
+# Start on generated SQL before the user clicks Run. The guard's EXPLAIN
+# surfaces parse and binder errors right away, and the first page (ROWS
+# rows) is fetched on the query service under a small time budget, so Run can
+# return at once when that is the whole result.
+import os
+from dataclasses import dataclass
+
+import duckdb
+
+from backend.guard import GuardDecision, QueryRejected, check_query
+from backend.results import PAGE_SIZE, ResultHandle
+from backend.worker_pool import DONE, get_query_service
+from observability import metrics
+
+ENABLED = os.getenv("SPECULATIVE_EXECUTION", "0") not in ("0", "false", "False")
+# Wall-clock budget of a speculative run; slower queries start again on Run
+TIMEOUT = float(os.getenv("SPECULATIVE_TIMEOUT", "5"))
+# Rows a speculative run fetches; a longer result is fetched again in full on Run
+ROWS = int(os.getenv("SPECULATIVE_ROWS", str(PAGE_SIZE)))
+
+
+@dataclass
+class Speculation:
+    sql: str  # the SQL as generated; a different SQL at Run time means it was edited
+    decision: GuardDecision = None
+    handle: ResultHandle = None
+    job_id: str = None
+    rows: int = None  # rows the speculative run fetches at most
+    error: str = None  # why the SQL cannot run as is
+
+
+def speculate(sql: str, session: str = "default", timeout: float = TIMEOUT, rows: int = ROWS) -> Speculation:
+    spec = Speculation(sql)
+    with metrics.span("speculate"):
+        try:
+            spec.decision = check_query(sql)
+        except (QueryRejected, duckdb.Error) as e:
+            spec.error = str(e)
+            metrics.incr("speculations", outcome="error")
+            return spec
+
+        # Expensive queries wait for the user's confirmation as usual
+        service = get_query_service()
+        if spec.decision.action == "confirm" or service is None:
+            return spec
+        spec.handle = ResultHandle(spec.decision.sql, session=session)
+        spec.rows = min(rows, spec.handle.max_rows)
+        spec.job_id = service.submit(spec.handle.result_sql(spec.rows), session=session, timeout=timeout)
+        metrics.incr("speculations", outcome="started")
+    return spec
+
+
+# Whether a claimed speculative run's result is all there is; when it is
+# not, the full result has to be fetched with handle.result_sql()
+def is_complete(spec: Speculation, table) -> bool:
+    return spec.rows >= spec.handle.max_rows or table.num_rows <= spec.rows
+
+
+# Hand the speculative run over to a Run click. Returns the job id to poll,
+# or None when the run is gone (budget exceeded, cancelled) and has to be
+# started again.
+def claim(spec: Speculation, heartbeat: float = None):
+    service = get_query_service()
+    job_id, spec.job_id = spec.job_id, None
+    if job_id is None or service is None:
+        return None
+    try:
+        if service.extend(job_id, heartbeat=heartbeat) or service.poll(job_id).state == DONE:
+            metrics.incr("speculations", outcome="claimed")
+            return job_id
+    except KeyError:
+        pass
+    metrics.incr("speculations", outcome="expired")
+    return None
+
+
+# The SQL was replaced or abandoned: stop its run, or drop its result if it
+# already finished
+def discard(spec: Speculation):
+    service = get_query_service()
+    if spec is None or spec.job_id is None or service is None:
+        return
+    service.release(spec.job_id)
+    spec.job_id = None
+    metrics.incr("speculations", outcome="discarded")
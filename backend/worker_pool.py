@@ -0,0 +1,534 @@
+# backend/worker_pool.py
+# Query execution service. Jobs are queued per session and handed to a pool
+# of workers in round-robin order across sessions, so one tab's heavy query
+# cannot hold up everyone else. Workers are threads sharing the process
+# engine, or processes that each keep a warm engine of their own and send
+# results back as Arrow IPC bytes.
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection
+
+import duckdb
+import pyarrow as pa
+
+from backend.engine import QueryTimeoutError, get_engine
+from backend.ingest import ROOT_DIR
+from backend.query_executor import run_sql_arrow
+from observability import metrics
+
+# 0 workers runs queries inline in the caller's thread
+WORKERS = int(os.getenv("QUERY_SERVICE_WORKERS", "2"))
+MODE = os.getenv("QUERY_SERVICE_MODE", "process")  # "process" or "thread"
+# Jobs of one session allowed to run at the same time
+SESSION_LIMIT = int(os.getenv("QUERY_SERVICE_SESSION_LIMIT", "2"))
+# Finished jobs whose result is never collected are dropped after this long
+RESULT_TTL = float(os.getenv("QUERY_SERVICE_RESULT_TTL", "300"))
+# Default wall-clock budget of a job from submission, queue wait included (0 disables)
+DEADLINE = float(os.getenv("QUERY_SERVICE_DEADLINE", "300"))
+# How often process workers report progress, and how often deadlines are checked
+PROGRESS_INTERVAL = float(os.getenv("QUERY_SERVICE_PROGRESS_INTERVAL", "0.25"))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class QueryCancelled(Exception):
+    pass
+
+
+class QueryFailed(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    session: str
+    sql: str
+    use_cache: bool = True
+    state: str = QUEUED
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float = None
+    finished_at: float = None
+    rows: int = None
+    error: str = None
+    progress: float = None  # percent done while running, if DuckDB can estimate it
+    deadline: float = None  # epoch seconds
+    heartbeat: float = None  # cancel when not polled for this many seconds
+    last_polled: float = field(default_factory=time.time)
+    cancel_requested: bool = False
+    cancel_error: Exception = field(default=None, repr=False)
+    result: object = field(default=None, repr=False)  # pa.Table, or the exception to raise
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (DONE, FAILED, CANCELLED)
+
+
+def to_ipc(table: pa.Table) -> pa.Buffer:
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def from_ipc(data) -> pa.Table:
+    return pa.ipc.open_stream(pa.py_buffer(data)).read_all()
+
+
+# Exceptions from a worker process arrive as (type name, message)
+def _rebuild_error(name: str, message: str) -> Exception:
+    if name == "QueryTimeoutError":
+        return QueryTimeoutError(message)
+    if name == "InterruptException":
+        return QueryCancelled(message)
+    # Keep DuckDB's own error types so callers see the same thing in both modes
+    error_type = getattr(duckdb, name, None)
+    if isinstance(error_type, type) and issubclass(error_type, duckdb.Error):
+        return error_type(message)
+    return QueryFailed(message)
+
+
+# --------------------------
+# Workers
+# --------------------------
+
+class _ThreadWorker:
+    def __init__(self, service, index: int):
+        self.service = service
+        self.job = None
+        self.ready = threading.Event()
+        self._inbox = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name=f"query-worker-{index}")
+        self._thread.start()
+
+    def _loop(self):
+        get_engine()
+        self.ready.set()
+        self.service._wake()
+        while True:
+            job = self._inbox.get()
+            if job is None:
+                return
+            try:
+                # A cancel that came before the scope is seen here, one after it
+                # when the next cursor is borrowed
+                with get_engine().interruptible():
+                    if job.cancel_requested:
+                        raise duckdb.InterruptException("Query cancelled before it started")
+                    table = run_sql_arrow(job.sql, use_cache=job.use_cache)
+                self.service._finish(self, job, DONE, table)
+            except duckdb.InterruptException as e:
+                self.service._finish(self, job, FAILED, QueryCancelled(str(e)))
+            except Exception as e:
+                self.service._finish(self, job, FAILED, e)
+
+    def start(self, job: Job):
+        self._inbox.put(job)
+
+    def cancel(self, job: Job):
+        get_engine().interrupt_thread(self._thread.ident)
+
+    def update_progress(self, job: Job):
+        job.progress = get_engine().thread_progress(self._thread.ident)
+
+    def stop(self):
+        self._inbox.put(None)
+
+
+# Entry point of a worker process: warm the engine, then run jobs in order.
+# A reader thread takes messages off the pipe so cancels arrive mid-query,
+# and a reporter thread sends the running job's progress.
+def _process_main(conn):
+    engine = get_engine()
+    main_thread = threading.get_ident()
+    inbox = queue.Queue()
+    current = {"job": None}
+    cancelled = set()  # jobs cancelled before they started running
+    send_lock = threading.Lock()
+    cancel_lock = threading.Lock()
+
+    def read():
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                inbox.put(None)
+                return
+            if message[0] == "cancel":
+                with cancel_lock:
+                    if current["job"] == message[1]:
+                        engine.interrupt_thread(main_thread)
+                    else:
+                        cancelled.add(message[1])
+            elif message[0] == "stop":
+                inbox.put(None)
+                return
+            else:
+                inbox.put(message)
+
+    def report():
+        while True:
+            time.sleep(PROGRESS_INTERVAL)
+            job_id = current["job"]
+            progress = engine.thread_progress(main_thread)
+            if job_id is None or progress is None:
+                continue
+            try:
+                with send_lock:
+                    conn.send(("progress", job_id, progress))
+            except OSError:
+                return
+
+    threading.Thread(target=read, daemon=True, name="query-worker-reader").start()
+    threading.Thread(target=report, daemon=True, name="query-worker-progress").start()
+    conn.send(("ready",))
+    while True:
+        message = inbox.get()
+        if message is None:
+            return
+        _, job_id, sql, use_cache = message
+        try:
+            with engine.interruptible():
+                # A job's cancel always follows its run message, so anything
+                # else in `cancelled` belongs to jobs that already finished
+                with cancel_lock:
+                    current["job"] = job_id
+                    early = job_id in cancelled
+                    cancelled.clear()
+                if early:
+                    raise duckdb.InterruptException("Query cancelled before it started")
+                table = run_sql_arrow(sql, use_cache=use_cache)
+            current["job"] = None
+            with send_lock:
+                conn.send(("done", job_id))
+                conn.send_bytes(to_ipc(table))
+        except Exception as e:
+            current["job"] = None
+            with send_lock:
+                conn.send(("error", job_id, type(e).__name__, str(e)))
+
+
+# Workers are fresh interpreters running this module (fork is unsafe with
+# DuckDB's threads, and multiprocessing's spawn would re-import __main__,
+# which under Streamlit is the app script). They talk over a socketpair.
+class _ProcessWorker:
+    def __init__(self, service, index: int):
+        self.service = service
+        self.job = None
+        self.ready = threading.Event()
+        self._send_lock = threading.Lock()
+        parent, child = socket.socketpair()
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(p for p in (str(ROOT_DIR), env.get("PYTHONPATH")) if p)
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "backend.worker_pool", str(child.fileno())],
+            pass_fds=(child.fileno(),), env=env, cwd=ROOT_DIR,
+        )
+        child.close()
+        self._conn = Connection(parent.detach())
+        threading.Thread(target=self._read, daemon=True, name=f"query-worker-{index}-reader").start()
+
+    def _send(self, message):
+        with self._send_lock:
+            self._conn.send(message)
+
+    def _read(self):
+        while True:
+            try:
+                message = self._conn.recv()
+                if message[0] == "ready":
+                    self.ready.set()
+                    self.service._wake()
+                elif message[0] == "progress":
+                    job = self.job
+                    if job is not None and job.id == message[1]:
+                        job.progress = message[2]
+                elif message[0] == "done":
+                    table = from_ipc(self._conn.recv_bytes())
+                    self.service._finish(self, self.job, DONE, table)
+                else:
+                    _, _, name, text = message
+                    self.service._finish(self, self.job, FAILED, _rebuild_error(name, text))
+            except (EOFError, OSError):
+                self.service._worker_exited(self)
+                return
+
+    def start(self, job: Job):
+        self._send(("run", job.id, job.sql, job.use_cache))
+
+    def cancel(self, job: Job):
+        self._send(("cancel", job.id))
+
+    def update_progress(self, job: Job):
+        pass  # pushed by the worker process
+
+    def stop(self):
+        try:
+            self._send(("stop",))
+        except OSError:
+            pass
+        try:
+            self._process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+        self._conn.close()
+
+
+# --------------------------
+# Service
+# --------------------------
+
+class QueryService:
+    def __init__(self, workers: int = WORKERS, mode: str = MODE, session_limit: int = SESSION_LIMIT):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if mode not in ("process", "thread"):
+            raise ValueError(f"Unknown worker mode: {mode!r}")
+        self.mode = mode
+        self.session_limit = session_limit
+        self._lock = threading.Condition()
+        self._jobs = {}
+        self._queues = OrderedDict()  # session -> deque of queued jobs, in serving order
+        self._running = {}  # session -> running job count
+        self._closed = False
+        worker_class = _ProcessWorker if mode == "process" else _ThreadWorker
+        self._workers = [worker_class(self, i) for i in range(workers)]
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True, name="query-dispatcher")
+        self._dispatcher.start()
+
+    # `timeout` bounds the job's wall clock from now (DEADLINE by default).
+    # With `heartbeat`, the job is treated as abandoned and cancelled when
+    # nobody polls it for that many seconds.
+    def submit(self, sql: str, session: str = "default", use_cache: bool = True,
+               timeout: float = None, heartbeat: float = None) -> str:
+        job = Job(uuid.uuid4().hex, session, sql, use_cache, heartbeat=heartbeat)
+        timeout = DEADLINE if timeout is None else timeout
+        if timeout:
+            job.deadline = job.submitted_at + timeout
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("QueryService is closed")
+            self._evict_expired()
+            self._jobs[job.id] = job
+            self._queues.setdefault(session, deque()).append(job)
+            self._lock.notify_all()
+        metrics.incr("query_jobs", state="submitted")
+        return job.id
+
+    # Current state and progress of a job; raises KeyError for unknown or collected jobs
+    def poll(self, job_id: str) -> Job:
+        with self._lock:
+            job = self._jobs[job_id]
+            job.last_polled = time.time()
+            if job.state == RUNNING:
+                for worker in self._workers:
+                    if worker.job is job:
+                        worker.update_progress(job)
+            return job
+
+    # Wait for a job and hand over its result. Raises what the query raised,
+    # QueryCancelled if it was cancelled, QueryTimeoutError if it ran past its
+    # deadline, or TimeoutError if it is still running after `timeout`.
+    def result(self, job_id: str, timeout: float = None) -> pa.Table:
+        job = self._jobs[job_id]
+        if not job.done.wait(timeout):
+            raise TimeoutError(f"Query job still {job.state} after {timeout}s")
+        with self._lock:
+            self._jobs.pop(job_id, None)
+        if job.state != DONE:
+            raise job.result
+        return job.result
+
+    def run(self, sql: str, session: str = "default", use_cache: bool = True,
+            timeout: float = None) -> pa.Table:
+        return self.result(self.submit(sql, session, use_cache, timeout=timeout))
+
+    # Give an unfinished job a fresh deadline (DEADLINE from now by default) and
+    # heartbeat, e.g. when a speculative run turns out to be wanted after all
+    def extend(self, job_id: str, timeout: float = None, heartbeat: float = None) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished or job.cancel_requested:
+                return False
+            timeout = DEADLINE if timeout is None else timeout
+            job.deadline = time.time() + timeout if timeout else None
+            job.heartbeat, job.last_polled = heartbeat, time.time()
+            return True
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return False
+            self._cancel(job, CANCELLED, QueryCancelled("Query cancelled"))
+            return True
+
+    # Forget a job whose result nobody will collect, cancelling it if it is
+    # still queued or running, instead of holding its result until RESULT_TTL
+    def release(self, job_id: str) -> bool:
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return False
+            if not job.finished:
+                self._cancel(job, CANCELLED, QueryCancelled("Query cancelled"))
+            return True
+
+    def cancel_session(self, session: str) -> int:
+        with self._lock:
+            ids = [j.id for j in self._jobs.values() if j.session == session and not j.finished]
+        return sum(self.cancel(job_id) for job_id in ids)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "workers": len(self._workers),
+                "busy": sum(w.job is not None for w in self._workers),
+                "queued": sum(len(q) for q in self._queues.values()),
+                "sessions": len(self._queues),
+            }
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for q in self._queues.values():
+                for job in q:
+                    self._complete(job, CANCELLED, QueryCancelled("Query service closed"))
+            self._queues.clear()
+            self._lock.notify_all()
+        for worker in self._workers:
+            worker.stop()
+
+    def _wake(self):
+        with self._lock:
+            self._lock.notify_all()
+
+    # Stop a job, queued or running; `state` and `error` are what it ends with
+    def _cancel(self, job: Job, state: str, error: Exception):
+        if job.cancel_requested:
+            return
+        job.cancel_requested, job.cancel_error = True, error
+        if job.state == QUEUED:
+            self._queues[job.session].remove(job)
+            self._complete(job, state, error)
+            return
+        for worker in self._workers:
+            if worker.job is job:
+                worker.cancel(job)
+
+    # Cancel jobs past their deadline and jobs nobody is polling any more
+    def _expire(self):
+        now = time.time()
+        for job in list(self._jobs.values()):
+            if job.finished:
+                continue
+            if job.deadline is not None and now > job.deadline:
+                waited = job.deadline - job.submitted_at
+                self._cancel(job, FAILED, QueryTimeoutError(f"Query exceeded {waited:g}s and was interrupted"))
+                metrics.incr("query_jobs_expired", reason="deadline")
+            elif job.heartbeat is not None and now - job.last_polled > job.heartbeat:
+                self._cancel(job, CANCELLED, QueryCancelled("Query abandoned"))
+                metrics.incr("query_jobs_expired", reason="abandoned")
+
+    def _dispatch_loop(self):
+        with self._lock:
+            while not self._closed:
+                self._expire()
+                if not self._dispatch_next():
+                    self._lock.wait(timeout=PROGRESS_INTERVAL)
+
+    # Hand the next job to an idle worker: sessions take turns, and a
+    # session at its running limit is skipped until one of its jobs finishes
+    def _dispatch_next(self) -> bool:
+        worker = next((w for w in self._workers if w.job is None and w.ready.is_set()), None)
+        if worker is None:
+            return False
+        for session in list(self._queues):
+            pending = self._queues[session]
+            if not pending:
+                del self._queues[session]
+                continue
+            if self._running.get(session, 0) >= self.session_limit:
+                continue
+            job = pending.popleft()
+            self._queues.move_to_end(session)
+            job.state, job.started_at = RUNNING, time.time()
+            worker.job = job
+            self._running[session] = self._running.get(session, 0) + 1
+            metrics.observe("job_queue_wait", job.started_at - job.submitted_at, mode=self.mode)
+            worker.start(job)
+            return True
+        return False
+
+    def _finish(self, worker, job: Job, state: str, result):
+        with self._lock:
+            worker.job = None
+            self._running[job.session] -= 1
+            if not self._running[job.session]:
+                del self._running[job.session]
+            # Cancelled jobs end cancelled (or timed out) even when the query
+            # finished before the interrupt reached it
+            if job.cancel_requested:
+                error = job.cancel_error
+                state, result = (CANCELLED if isinstance(error, QueryCancelled) else FAILED), error
+            self._complete(job, state, result)
+            self._lock.notify_all()
+
+    def _complete(self, job: Job, state: str, result):
+        job.state, job.result, job.finished_at = state, result, time.time()
+        if state == DONE:
+            job.rows = result.num_rows
+        else:
+            job.error = str(result)
+        if job.started_at is not None:
+            metrics.observe("job_run", job.finished_at - job.started_at, mode=self.mode, state=state)
+        metrics.incr("query_jobs", state=state)
+        job.done.set()
+
+    # A worker process died (crash, OOM kill): fail its job and replace it
+    def _worker_exited(self, worker):
+        with self._lock:
+            if worker.job is not None:
+                self._finish(worker, worker.job, FAILED, QueryFailed("Query worker exited unexpectedly"))
+            if self._closed:
+                return
+            index = self._workers.index(worker)
+            self._workers[index] = _ProcessWorker(self, index)
+            metrics.incr("query_worker_restarts")
+
+    def _evict_expired(self):
+        cutoff = time.time() - RESULT_TTL
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+# Process-wide service, or None when QUERY_SERVICE_WORKERS=0
+def get_query_service():
+    global _service
+    if WORKERS < 1:
+        return None
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = QueryService()
+    return _service
+
+
+if __name__ == "__main__":
+    _process_main(Connection(int(sys.argv[1])))
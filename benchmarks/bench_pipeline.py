@@ -0,0 +1,233 @@
+# benchmarks/bench_pipeline.py
+# Stage-by-stage benchmark of the generate → execute pipeline against the
+# local stub LLM and synthetic datasets. Usage:
+#   python -m benchmarks.bench_pipeline --scales 1000,100000,1000000 -o bench.json
+#   python -m benchmarks.bench_pipeline -o new.json --baseline old.json
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.synthetic_data import ensure_dataset
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+QUESTIONS = [
+    "What is the total claim amount by broker?",
+    "What is the average claim amount by line of business for closed claims?",
+    "How many claims are there by state?",
+    "How many open claims are there by claim type?",
+    "What is the total claim amount by status?",
+    "Average claim amount for denied claims",
+]
+
+
+# Peak resident set size of this process so far, in MB
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(stage: str, scale, samples: list) -> dict:
+    ordered = sorted(samples)
+    total = sum(samples)
+    return {
+        "stage": stage,
+        "scale": scale,
+        "iterations": len(samples),
+        "mean_ms": round(total / len(samples) * 1000, 3),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "throughput_per_s": round(len(samples) / total, 2) if total else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# Time fn() `iterations` times; setup() runs untimed before each call
+def measure(fn, iterations: int, setup=None) -> list:
+    samples = []
+    for _ in range(iterations):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        fn(arg) if setup else fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_llm_stages(iterations: int, results: list):
+    import llm.text2sql_agent as agent
+
+    def cold_load():
+        agent._schema_cache.clear()
+        agent.load_schema()
+
+    results.append(summarize("schema_load_cold", None, measure(cold_load, iterations)))
+    results.append(summarize("schema_load", None, measure(agent.load_schema, iterations)))
+
+    questions = iter(QUESTIONS * iterations)
+    results.append(summarize("prompt_build", None,
+                             measure(lambda: agent.prepare_messages(next(questions)), iterations)))
+
+    questions = iter(QUESTIONS * iterations)
+    results.append(summarize("llm_call", None,
+                             measure(lambda: agent.generate_sql(next(questions), use_cache=False), iterations)))
+
+
+def bench_engine_stages(scale: int, iterations: int, results: list, sqls: list):
+    import duckdb
+    from backend.engine import QueryEngine
+    from backend.query_executor import run_sql_query
+    import backend.engine as engine_module
+
+    data_dir = ensure_dataset(scale)
+    store_dir = Path(tempfile.mkdtemp(prefix="bench_store_"))
+
+    start = time.perf_counter()
+    engine = QueryEngine(data_dir=data_dir, store_dir=store_dir, pool_size=2)
+    results.append(summarize("ingest_and_engine_start", scale, [time.perf_counter() - start]))
+
+    # The per-query setup the engine replaces: a fresh connection plus views
+    results.append(summarize("connection_setup", scale, measure(
+        lambda: duckdb.connect(database=":memory:").close(), iterations)))
+
+    def create_views(con):
+        for table, path in engine._views.items():
+            con.execute(f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM '{path.as_posix()}'")
+        con.close()
+
+    results.append(summarize("view_creation", scale, measure(
+        create_views, iterations, setup=lambda: duckdb.connect(database=":memory:"))))
+
+    def checkout():
+        with engine.cursor():
+            pass
+
+    results.append(summarize("cursor_checkout", scale, measure(checkout, iterations)))
+
+    exec_samples, convert_samples = [], []
+    for i in range(iterations):
+        sql = sqls[i % len(sqls)]
+        with engine.cursor() as cur:
+            start = time.perf_counter()
+            rel = cur.execute(sql)
+            mid = time.perf_counter()
+            rel.fetchdf()
+            end = time.perf_counter()
+        exec_samples.append(mid - start)
+        convert_samples.append(end - mid)
+    results.append(summarize("execution", scale, exec_samples))
+    results.append(summarize("dataframe_conversion", scale, convert_samples))
+
+    # Whole backend call as the app makes it, with the result cache bypassed
+    previous, engine_module._engine = engine_module._engine, engine
+    try:
+        queries = iter(sqls * iterations)
+        results.append(summarize("run_sql_query", scale, measure(
+            lambda: run_sql_query(next(queries), use_cache=False), iterations)))
+    finally:
+        engine_module._engine = previous
+        engine.close()
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Stages whose p50 regressed by more than `tolerance` against a baseline report
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    old = {(r["stage"], r["scale"]): r for r in baseline["results"]}
+    regressions = []
+    for row in report["results"]:
+        before = old.get((row["stage"], row["scale"]))
+        if before and before["p50_ms"] > 0 and row["p50_ms"] > before["p50_ms"] * (1 + tolerance):
+            regressions.append({
+                "stage": row["stage"],
+                "scale": row["scale"],
+                "baseline_p50_ms": before["p50_ms"],
+                "p50_ms": row["p50_ms"],
+            })
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the text-to-SQL pipeline stage by stage")
+    parser.add_argument("--scales", default="1000,100000",
+                        help="comma-separated claim row counts (e.g. 1000,100000,1000000,10000000)")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="stub time to first token, seconds")
+    parser.add_argument("-o", "--output", type=Path, help="write the JSON report here")
+    parser.add_argument("--baseline", type=Path, help="earlier report to compare p50s against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p50 slowdown vs baseline")
+    args = parser.parse_args(argv)
+
+    from llm.stub_server import serve_in_thread
+
+    stub = serve_in_thread(latency=args.llm_latency)
+    os.environ["LLM_BASE_URL"] = stub.base_url
+    os.environ.setdefault("HF_TOKEN", "stub")
+
+    import duckdb
+    from llm.stub_server import stub_sql
+
+    results = []
+    bench_llm_stages(args.iterations, results)
+    sqls = [stub_sql(q) for q in QUESTIONS]
+    for scale in [int(s) for s in args.scales.split(",") if s]:
+        bench_engine_stages(scale, args.iterations, results, sqls)
+    stub.shutdown()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "duckdb": duckdb.__version__,
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "llm_latency_s": args.llm_latency,
+        },
+        "results": results,
+    }
+
+    status = 0
+    if args.baseline:
+        report["regressions"] = compare(report, json.loads(args.baseline.read_text()), args.tolerance)
+        status = 1 if report["regressions"] else 0
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    else:
+        print(text)
+
+    for row in results:
+        scale = "" if row["scale"] is None else row["scale"]
+        print(f"{row['stage']:<26}{scale:>10}  p50 {row['p50_ms']:>9.3f} ms  p95 {row['p95_ms']:>9.3f} ms  "
+              f"p99 {row['p99_ms']:>9.3f} ms  rss {row['peak_rss_mb']:>7.1f} MB", file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# benchmarks/import_budget.py
+# Cold import time of each entry point, measured in a fresh interpreter and
+# checked against a budget. Also fails when a module that should load lazily
+# (pandas, openai) was imported. Exit code 1 on any violation, so CI can run it.
+# Usage:
+#   python -m benchmarks.import_budget
+#   python -m benchmarks.import_budget --repeat 5 --explain -o imports.json
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# module -> (budget in ms, modules it must not import)
+BUDGETS = {
+    "observability.metrics": (100, ("duckdb", "pyarrow", "pandas", "openai")),
+    "backend.resources": (100, ("duckdb", "pyarrow", "pandas", "openai")),
+    "llm.text2sql_agent": (200, ("duckdb", "pandas", "openai")),
+    "llm.async_client": (200, ("duckdb", "pandas", "openai")),
+    "backend.engine": (500, ("pandas", "openai")),
+    "backend.results": (500, ("pandas", "openai")),
+    "backend.guard": (500, ("pandas", "openai")),
+    "pipeline.repair": (600, ("pandas", "openai")),
+    "pipeline.batch": (600, ("pandas", "openai")),
+}
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "modules": sorted(sys.modules)}}))
+"""
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT_DIR), env.get("PYTHONPATH")]))
+    env.setdefault("HF_TOKEN", "unused")
+    return env
+
+
+# Best-of-N wall clock for `import module` in a new interpreter, and what it loaded
+def measure(module: str, repeat: int) -> dict:
+    best, loaded = None, None
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", _PROBE.format(module=module)], env=_env(),
+                             cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout
+        probe = json.loads(out.strip().splitlines()[-1])
+        if best is None or probe["ms"] < best:
+            best, loaded = probe["ms"], set(probe["modules"])
+    return {"ms": round(best, 1), "modules": loaded}
+
+
+# Modules with the largest self time, from -X importtime
+def explain(module: str, top: int = 10) -> list:
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], env=_env(),
+                         cwd=ROOT_DIR, capture_output=True, text=True).stderr
+    rows = []
+    for line in err.splitlines():
+        parts = [p.strip() for p in line.removeprefix("import time:").split("|")]
+        if len(parts) == 3 and parts[0].isdigit():
+            rows.append((int(parts[0]) / 1000, parts[2]))
+    return [{"module": name, "self_ms": round(ms, 1)} for ms, name in sorted(rows, reverse=True)[:top]]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check cold import times against their budgets")
+    parser.add_argument("modules", nargs="*", help="modules to check (default: all budgeted)")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters per module; the best counts")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget, e.g. for slow CI machines")
+    parser.add_argument("--explain", action="store_true", help="list the slowest imports of failing modules")
+    parser.add_argument("-o", "--output", type=Path, help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    results, failures = [], 0
+    for module in args.modules or BUDGETS:
+        budget, forbidden = BUDGETS.get(module, (None, ()))
+        measured = measure(module, args.repeat)
+        budget_ms = budget * args.scale if budget is not None else None
+        eager = sorted(m for m in forbidden if m in measured["modules"])
+        ok = (budget_ms is None or measured["ms"] <= budget_ms) and not eager
+        row = {"module": module, "ms": measured["ms"], "budget_ms": budget_ms,
+               "eager_imports": eager, "ok": ok}
+        if not ok and args.explain:
+            row["slowest"] = explain(module)
+        results.append(row)
+        failures += not ok
+        status = "ok" if ok else "OVER" if not eager else "EAGER " + ",".join(eager)
+        budget_text = f"{budget_ms:.0f}" if budget_ms is not None else "-"
+        print(f"{module:<24} {measured['ms']:>8.1f} ms  budget {budget_text:>5}  {status}", file=sys.stderr)
+        for item in row.get("slowest", []):
+            print(f"    {item['self_ms']:>8.1f} ms  {item['module']}", file=sys.stderr)
+
+    if args.output:
+        args.output.write_text(json.dumps({"results": results}, indent=2))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
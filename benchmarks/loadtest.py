@@ -0,0 +1,378 @@
+# benchmarks/loadtest.py
+# Headless load test: N simulated users ask questions from a replayable corpus
+# with think times in between, through the same code path as app/app.py
+# (generate + validate/repair, cost guard, first result page on the query
+# service), against the local stub LLM. Concurrency ramps through the given
+# levels and each level reports latency percentiles, throughput, error rate
+# and memory. Usage:
+#   python -m benchmarks.loadtest --users 1,4,16,64 --duration 30 -o load.json
+#   python -m benchmarks.loadtest --driver apptest --users 1,4 --duration 20
+#   python -m benchmarks.loadtest --corpus questions.jsonl --scale 100000 --slo-ms 1500
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.bench_pipeline import QUESTIONS, _git_commit, peak_rss_mb, percentile
+
+APP_PATH = Path(__file__).resolve().parent.parent / "app" / "app.py"
+STAGES = ("generate", "guard", "run")
+
+
+# Weighted questions, one JSON object ({"question", "weight"}) or string per line
+def load_corpus(path: Path = None) -> list:
+    if path is None:
+        return [(q, 1.0) for q in QUESTIONS]
+    corpus = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"question": item}
+            corpus.append((item["question"], float(item.get("weight", 1.0))))
+    return corpus
+
+
+# Resident set size of a process right now, in MB (Linux; peak RSS elsewhere)
+def rss_mb(pid="self") -> float:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return peak_rss_mb() if pid == "self" else 0.0
+
+
+def workers_rss_mb() -> float:
+    from backend.worker_pool import get_query_service
+
+    service = get_query_service()
+    if service is None or service.mode != "process":
+        return 0.0
+    return round(sum(rss_mb(w._process.pid) for w in service._workers), 1)
+
+
+# One simulated user's stream: questions drawn by weight, exponential think
+# times. Seeded per user, so a run can be replayed exactly. The same question
+# is never asked twice in a row: the app keeps the last answer on screen
+# instead of asking again.
+class Script:
+    def __init__(self, corpus: list, think: float, seed: int, user: int):
+        self.rng = random.Random(f"{seed}:{user}")
+        self.questions = [q for q, _ in corpus]
+        self.weights = [w for _, w in corpus]
+        self.think = think
+        self.last = None
+
+    def next_question(self) -> str:
+        question = self.rng.choices(self.questions, self.weights)[0]
+        while question == self.last and len(set(self.questions)) > 1:
+            question = self.rng.choices(self.questions, self.weights)[0]
+        self.last = question
+        return question
+
+    def think_time(self) -> float:
+        if self.think <= 0:
+            return 0.0
+        return min(self.rng.expovariate(1 / self.think), self.think * 5)
+
+
+# --------------------------
+# Drivers: one interaction = ask a question and get the first result page
+# --------------------------
+
+class ApiDriver:
+    def __init__(self, use_cache: bool = True):
+        from backend.guard import check_query
+        from backend.results import ResultHandle
+        from pipeline import repair
+
+        self._answer = repair.answer
+        self._check = check_query
+        self._handle = ResultHandle
+        self.use_cache = use_cache
+        self.session = uuid.uuid4().hex
+
+    def interact(self, question: str, timings: dict):
+        start = time.perf_counter()
+        outcome = self._answer(question, use_cache=self.use_cache)
+        timings["generate"] = time.perf_counter() - start
+        if outcome.error:
+            raise RuntimeError(f"SQL still invalid after repairs: {outcome.error.splitlines()[0]}")
+
+        start = time.perf_counter()
+        decision = self._check(outcome.sql)
+        timings["guard"] = time.perf_counter() - start
+        if decision.action == "confirm":
+            raise RuntimeError("query needs confirmation")
+
+        start = time.perf_counter()
+        self._handle(decision.sql, session=self.session).page(0)
+        timings["run"] = time.perf_counter() - start
+
+    def close(self):
+        pass
+
+
+# AppTest swaps process-wide Streamlit globals (the runtime, config) for the
+# length of a script run, so reruns from different users are serialized.
+# Queries still overlap: they run on the query service between polls.
+_apptest_lock = threading.Lock()
+
+
+# Drives the real Streamlit script with AppTest: type, click Run, poll reruns
+class AppTestDriver:
+    def __init__(self, timeout: float = 120):
+        from streamlit.testing.v1 import AppTest
+
+        self.timeout = timeout
+        self.app = AppTest.from_file(str(APP_PATH), default_timeout=timeout)
+        self._rerun(self.app)
+
+    def _rerun(self, element):
+        with _apptest_lock:
+            element.run()
+
+    def interact(self, question: str, timings: dict):
+        at = self.app
+        start = time.perf_counter()
+        self._rerun(at.text_input(key="user_input").set_value(question))
+        timings["generate"] = time.perf_counter() - start
+        if at.session_state.pending_sql is None:
+            raise RuntimeError(_first_error(at) or "no SQL generated")
+
+        start = time.perf_counter()
+        self._rerun(at.button(key="run_query_button").click())
+        deadline = time.perf_counter() + self.timeout
+        while at.session_state.running_job is not None and time.perf_counter() < deadline:
+            time.sleep(0.05)
+            self._rerun(at)
+        timings["run"] = time.perf_counter() - start
+        if at.session_state.query_result is None:
+            error = _first_error(at)
+            self._rerun(at.button(key="submit_another_top").click())
+            raise RuntimeError(error or "query did not finish")
+        self._rerun(at.button(key="submit_another_bottom").click())
+
+    def close(self):
+        from backend.worker_pool import get_query_service
+
+        service = get_query_service()
+        if service is not None:
+            service.cancel_session(self.app.session_state.session_id)
+
+
+def _first_error(at) -> str:
+    return next((e.value for e in at.error), None)
+
+
+# --------------------------
+# Ramp
+# --------------------------
+
+def _user_loop(driver_factory, script: Script, stop: threading.Event, samples: list, errors: Counter,
+               lock: threading.Lock):
+    try:
+        driver = driver_factory()
+    except Exception as e:
+        with lock:
+            errors[f"setup: {type(e).__name__}"] += 1
+        return
+    try:
+        # Stagger arrivals instead of starting every user at the same instant
+        if stop.wait(script.rng.uniform(0, script.think)):
+            return
+        while not stop.is_set():
+            question = script.next_question()
+            timings = {}
+            start = time.perf_counter()
+            try:
+                driver.interact(question, timings)
+                timings["total"] = time.perf_counter() - start
+                with lock:
+                    samples.append(timings)
+            except Exception as e:
+                with lock:
+                    errors[type(e).__name__] += 1
+            if stop.wait(script.think_time()):
+                return
+    finally:
+        driver.close()
+
+
+def _latency(values: list) -> dict:
+    ordered = sorted(values)
+    if not ordered:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    return {
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def run_level(users: int, duration: float, driver_factory, corpus: list, think: float, seed: int) -> dict:
+    samples, errors, lock, stop = [], Counter(), threading.Lock(), threading.Event()
+    rss_before = rss_mb()
+    threads = [
+        threading.Thread(target=_user_loop, daemon=True, name=f"load-user-{i}",
+                         args=(driver_factory, Script(corpus, think, seed, i), stop, samples, errors, lock))
+        for i in range(users)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    completed = len(samples)
+    failed = sum(errors.values())
+    row = {
+        "users": users,
+        "duration_s": round(elapsed, 2),
+        "requests": completed + failed,
+        "completed": completed,
+        "throughput_per_s": round(completed / elapsed, 2),
+        "error_rate": round(failed / (completed + failed), 4) if completed + failed else 0.0,
+        "errors": dict(errors),
+        **_latency([s["total"] for s in samples]),
+        "stages": {stage: _latency([s[stage] for s in samples if stage in s]) for stage in STAGES},
+        "rss_mb": rss_mb(),
+        "rss_growth_mb": round(rss_mb() - rss_before, 1),
+        "workers_rss_mb": workers_rss_mb(),
+    }
+    return row
+
+
+# Largest level that met the SLO, and the first where latency collapsed
+# (p95 over the SLO or errors over the budget)
+def capacity(results: list, slo_ms: float, max_error_rate: float) -> dict:
+    within, collapsed = None, None
+    for row in results:
+        ok = (row["p95_ms"] is not None and row["p95_ms"] <= slo_ms
+              and row["error_rate"] <= max_error_rate)
+        if ok and collapsed is None:
+            within = row["users"]
+        elif not ok and collapsed is None:
+            collapsed = row["users"]
+    return {"slo_p95_ms": slo_ms, "max_error_rate": max_error_rate,
+            "max_users_within_slo": within, "first_users_over_slo": collapsed}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the question → SQL → result path with simulated users")
+    parser.add_argument("--users", default="1,4,16", help="comma-separated concurrency levels to ramp through")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per level")
+    parser.add_argument("--think", type=float, default=2.0, help="mean think time between questions, seconds")
+    parser.add_argument("--corpus", type=Path, help="JSONL of questions (with optional weights)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for question and think-time draws")
+    parser.add_argument("--driver", choices=("api", "apptest"), default="api")
+    parser.add_argument("--scale", type=int, help="run against a synthetic dataset with this many claims")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="stub time to first token, seconds")
+    parser.add_argument("--cold", action="store_true", help="bypass the SQL and repair caches")
+    parser.add_argument("--slo-ms", type=float, default=2000.0, help="p95 latency target per interaction")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("-o", "--output", type=Path, help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    # Caches, spilled sessions and the columnar store go to a scratch directory
+    # that is removed afterwards, however the run ends
+    with tempfile.TemporaryDirectory(prefix="loadtest_") as scratch:
+        return _run(args, Path(scratch))
+
+
+def _run(args, scratch: Path) -> int:
+    # Everything below reads its configuration at import time
+    os.environ.setdefault("HF_TOKEN", "stub")
+    os.environ["SQL_CACHE_PATH"] = str(scratch / "sql_cache.json")
+    os.environ["REPAIR_CACHE_PATH"] = str(scratch / "repair_cache.json")
+    os.environ["SESSION_SPILL_DIR"] = str(scratch / "sessions")
+    if args.scale:
+        from benchmarks.synthetic_data import ensure_dataset
+
+        os.environ["QUERY_DATA_DIR"] = str(ensure_dataset(args.scale))
+        os.environ["COLUMNAR_STORE_DIR"] = str(scratch / "store")
+
+    from llm.stub_server import serve_in_thread
+
+    stub = serve_in_thread(latency=args.llm_latency)
+    os.environ["LLM_BASE_URL"] = stub.base_url
+
+    import duckdb
+    from backend import resources
+    from backend.worker_pool import get_query_service
+
+    service = None
+    try:
+        # Same startup warmup as the app, so the first level does not pay for it
+        resources.warm(background=False)
+        service = get_query_service()
+        corpus = load_corpus(args.corpus)
+        if args.driver == "api":
+            driver_factory = lambda: ApiDriver(use_cache=not args.cold)
+        else:
+            driver_factory = AppTestDriver
+
+        results = []
+        for users in [int(u) for u in args.users.split(",") if u]:
+            row = run_level(users, args.duration, driver_factory, corpus, args.think, args.seed)
+            results.append(row)
+            print(f"users {users:>4}  {row['throughput_per_s']:>7.2f}/s  p50 {row['p50_ms'] or 0:>9.1f} ms  "
+                  f"p95 {row['p95_ms'] or 0:>9.1f} ms  p99 {row['p99_ms'] or 0:>9.1f} ms  "
+                  f"errors {row['error_rate']:.2%}  rss {row['rss_mb']:>7.1f} MB (+{row['rss_growth_mb']})",
+                  file=sys.stderr)
+        service_stats = service.stats() if service is not None else None
+    finally:
+        # Workers must stop writing to the scratch directory before it goes
+        stub.shutdown()
+        if service is not None:
+            service.close()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "duckdb": duckdb.__version__,
+            "platform": platform.platform(),
+            "driver": args.driver,
+            "corpus": str(args.corpus) if args.corpus else "builtin",
+            "seed": args.seed,
+            "think_s": args.think,
+            "llm_latency_s": args.llm_latency,
+            "scale": args.scale,
+            "cold": args.cold,
+            "query_service": service_stats,
+        },
+        "results": results,
+        "capacity": capacity(results, args.slo_ms, args.max_error_rate),
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+# benchmarks/synthetic_data.py
+# Deterministic insurance datasets with the same columns and value domains as
+# data/*.csv, scaled to any number of claims. Usage:
+#   python -m benchmarks.synthetic_data 1000000 --out benchmarks/.data/claims_1000000
+import argparse
+from pathlib import Path
+
+import duckdb
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SOURCE_DIR = ROOT_DIR / "data"
+DATA_CACHE = Path(__file__).resolve().parent / ".data"
+
+
+def _lit(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+# Categorical values observed in the checked-in sample data
+def _domains(con, source_dir: Path) -> dict:
+    claims = (source_dir / "claims.csv").as_posix()
+    domains = {}
+    for column in ("STATE", "LINE_OF_BUSINESS", "CLAIM_TYPE", "CLAIM_STATUS", "NOTES"):
+        rows = con.execute(f"SELECT DISTINCT {column} FROM '{claims}' ORDER BY 1").fetchall()
+        domains[column] = "[" + ", ".join(_lit(r[0]) for r in rows) + "]"
+    return domains
+
+
+# Row counts per table for a given number of claims, keeping the sample's ratios
+def table_sizes(claims: int) -> dict:
+    return {
+        "claims": claims,
+        "policies": max(1000, claims // 2),
+        "customers": max(1000, claims // 5),
+        "brokers": max(10, claims // 10000),
+    }
+
+
+def generate(claims: int, out_dir: Path, source_dir: Path = SOURCE_DIR) -> Path:
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    sizes = table_sizes(claims)
+    con = duckdb.connect(database=":memory:")
+    try:
+        d = _domains(con, source_dir)
+        pick = lambda domain, salt: f"{d[domain]}[1 + (hash(i, {salt}) % len({d[domain]}))::INTEGER]"
+
+        queries = {
+            "brokers": f"""
+                SELECT printf('Broker_%d', i + 1) AS BROKER_ID,
+                       printf('Broker_%d LLC', i + 1) AS BROKER_NAME,
+                       round(3.0 + (hash(i, 1) % 20) / 10.0, 1) AS BROKER_RATING
+                FROM range({sizes['brokers']}) t(i)
+            """,
+            "customers": f"""
+                SELECT printf('CU%d', 1000 + i) AS CUSTOMER_ID,
+                       25 + (hash(i, 1) % 50)::INTEGER AS CUSTOMER_AGE,
+                       {pick('STATE', 2)} AS CUSTOMER_STATE,
+                       30000 + (hash(i, 3) % 120000)::INTEGER AS CUSTOMER_INCOME
+                FROM range({sizes['customers']}) t(i)
+            """,
+            "policies": f"""
+                SELECT printf('P%d', 10000 + i) AS POLICY_ID,
+                       printf('CU%d', 1000 + hash(i, 1) % {sizes['customers']}) AS CUSTOMER_ID,
+                       {pick('LINE_OF_BUSINESS', 2)} AS LINE_OF_BUSINESS,
+                       TIMESTAMP '2022-11-01' + to_seconds((hash(i, 3) % (800 * 86400))::BIGINT) AS START_DATE,
+                       START_DATE + to_days((230 + hash(i, 4) % 1100)::INTEGER) AS END_DATE,
+                       round(500 + (hash(i, 5) % 450000) / 100.0, 2) AS PREMIUM_AMOUNT
+                FROM range({sizes['policies']}) t(i)
+            """,
+            "claims": f"""
+                SELECT printf('C%08d', i) AS CLAIM_ID,
+                       printf('P%d', 10000 + hash(i, 1) % {sizes['policies']}) AS POLICY_ID,
+                       printf('CU%d', 1000 + hash(i, 2) % {sizes['customers']}) AS CUSTOMER_ID,
+                       {pick('STATE', 3)} AS STATE,
+                       {pick('LINE_OF_BUSINESS', 4)} AS LINE_OF_BUSINESS,
+                       printf('Broker_%d', 1 + hash(i, 5) % {sizes['brokers']}) AS BROKER_ID,
+                       {pick('CLAIM_TYPE', 6)} AS CLAIM_TYPE,
+                       round(0.5 + (hash(i, 7) % 3300000) / 100.0, 2) AS CLAIM_AMOUNT,
+                       {pick('CLAIM_STATUS', 8)} AS CLAIM_STATUS,
+                       TIMESTAMP '2024-07-29' + to_seconds((hash(i, 9) % (365 * 86400))::BIGINT) AS DATE_REPORTED,
+                       {pick('NOTES', 10)} AS NOTES,
+                       CASE WHEN CLAIM_STATUS = 'Closed'
+                            THEN DATE_REPORTED + to_days((1 + hash(i, 11) % 65)::INTEGER) END AS DATE_RESOLVED,
+                       (CLAIM_STATUS = 'Closed')::INTEGER AS IS_CLOSED
+                FROM range({sizes['claims']}) t(i)
+            """,
+        }
+        for table, query in queries.items():
+            target = out_dir / f"{table}.csv"
+            tmp = out_dir / f"{table}.csv.tmp"
+            con.execute(f"COPY ({query}) TO {_lit(tmp.as_posix())} (HEADER, DELIMITER ',')")
+            tmp.replace(target)
+    finally:
+        con.close()
+    return out_dir
+
+
+# Generated once per scale and reused across benchmark runs
+def ensure_dataset(claims: int, cache_dir: Path = DATA_CACHE) -> Path:
+    out_dir = Path(cache_dir) / f"claims_{claims}"
+    if not all((out_dir / f"{t}.csv").exists() for t in table_sizes(claims)):
+        generate(claims, out_dir)
+    return out_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic insurance dataset")
+    parser.add_argument("claims", type=int, help="number of claim rows")
+    parser.add_argument("--out", type=Path, default=None, help="output directory")
+    args = parser.parse_args()
+    path = generate(args.claims, args.out or DATA_CACHE / f"claims_{args.claims}")
+    print(path)
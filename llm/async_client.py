@@ -0,0 +1,179 @@
+# llm/async_client.py
+import asyncio
+import os
+import random
+import threading
+
+from llm.sql_cache import get_sql_cache
+from llm.text2sql_agent import BACKEND, BASE_URL, HF_TOKEN, MODEL, get_backend, prepare_messages, schema_hash
+from observability import metrics
+
+REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30.0"))
+
+# One event loop, on its own thread, owns the client (and its pooled HTTP
+# connections) and the concurrency cap. Async connections cannot be shared
+# between loops, and callers run on many: asyncio.run per call, Streamlit
+# script threads, the batch CLI. Routing every request through this loop
+# keeps one connection pool and one limit for the whole process.
+_loop = None
+_client = None
+_semaphore = None
+_loop_lock = threading.Lock()
+
+
+def _owner_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _semaphore
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, daemon=True, name="llm-client-loop").start()
+                _semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+                _loop = loop
+    return _loop
+
+
+# openai is imported on first use; it costs more than the rest of the
+# pipeline's imports together
+def get_async_client():
+    global _client
+    if _client is None:
+        with _loop_lock:
+            if _client is None:
+                from openai import AsyncOpenAI
+
+                _client = AsyncOpenAI(
+                    base_url=BASE_URL,
+                    api_key=HF_TOKEN or "unused",
+                    timeout=REQUEST_TIMEOUT,
+                    max_retries=0,  # retries are handled below, with our own backoff
+                )
+    return _client
+
+
+# Cold starts on the router and rate limits clear up on their own
+def is_retryable(exc: Exception) -> bool:
+    import openai
+
+    if isinstance(exc, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return "model_pending_deploy" in str(exc)
+
+
+def _backoff(attempt: int) -> float:
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+    return delay * (0.5 + random.random() / 2)
+
+
+# Runs on the owner loop: send each token to `emit`, then ("end", None), or
+# ("error", exc). A failed attempt is retried only if nothing was emitted
+# yet, so callers never see duplicated output.
+async def _stream(messages: list, timeout: float, emit):
+    client = get_async_client()
+    attempt = 0
+    while True:
+        emitted = False
+        try:
+            async with _semaphore:
+                stream = await asyncio.wait_for(
+                    client.chat.completions.create(model=MODEL, messages=messages, stream=True),
+                    timeout,
+                )
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + timeout
+                async with stream:  # releases the pooled connection on any exit
+                    iterator = stream.__aiter__()
+                    while True:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            raise asyncio.TimeoutError()
+                        try:
+                            chunk = await asyncio.wait_for(iterator.__anext__(), remaining)
+                        except StopAsyncIteration:
+                            break
+                        if not chunk.choices:
+                            continue
+                        token = chunk.choices[0].delta.content
+                        if token:
+                            emitted = True
+                            emit(("token", token))
+            emit(("end", None))
+            return
+        except asyncio.TimeoutError:
+            emit(("error", TimeoutError(f"LLM request exceeded {timeout}s")))
+            return
+        except Exception as e:
+            if emitted or attempt >= MAX_RETRIES or not is_retryable(e):
+                emit(("error", e))
+                return
+            metrics.incr("llm_retries", reason=type(e).__name__)
+            await asyncio.sleep(_backoff(attempt))
+            attempt += 1
+
+
+# Stream SQL tokens as the model produces them, from any event loop. The
+# request itself runs on the owner loop; closing the generator early or
+# cancelling the caller cancels it there too.
+async def astream_sql(question: str, schema_path: str = None, context_sql: str = None,
+                      timeout: float = REQUEST_TIMEOUT):
+    messages = prepare_messages(question, schema_path, context_sql)
+    caller = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def emit(event):
+        try:
+            caller.call_soon_threadsafe(events.put_nowait, event)
+        except RuntimeError:
+            pass  # the caller's loop is gone; the request is being cancelled
+
+    request = asyncio.run_coroutine_threadsafe(_stream(messages, timeout, emit), _owner_loop())
+    try:
+        while True:
+            kind, value = await events.get()
+            if kind == "end":
+                return
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        request.cancel()
+
+
+# Async counterpart of generate_sql. on_token, if given, is called with each
+# streamed fragment so a UI can render the SQL while it is produced.
+async def agenerate_sql(question: str, schema_path: str = None, context_sql: str = None,
+                        use_cache: bool = True, on_token=None,
+                        timeout: float = REQUEST_TIMEOUT) -> str:
+    cache = get_sql_cache() if use_cache else None
+    if cache is not None:
+        fingerprint = schema_hash(schema_path)
+        cached = cache.get(question, context_sql, MODEL, fingerprint)
+        metrics.incr("sql_cache", result="miss" if cached is None else "hit")
+        if cached is not None:
+            if on_token is not None:
+                on_token(cached)
+            return cached
+
+    if BACKEND == "openai":
+        parts = []
+        with metrics.span("llm_request", mode="stream", backend=BACKEND):
+            async for token in astream_sql(question, schema_path, context_sql, timeout=timeout):
+                parts.append(token)
+                if on_token is not None:
+                    on_token(token)
+        sql = "".join(parts).strip()
+    else:
+        # In-process models batch calls from all threads; the reply arrives whole
+        messages = prepare_messages(question, schema_path, context_sql)
+        with metrics.span("llm_request", mode="local", backend=BACKEND):
+            sql = (await asyncio.wait_for(asyncio.to_thread(get_backend().complete, messages), timeout)).strip()
+        if on_token is not None:
+            on_token(sql)
+
+    if cache is not None:
+        cache.put(question, context_sql, MODEL, fingerprint, sql)
+    return sql
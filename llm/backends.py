@@ -0,0 +1,195 @@
+# llm/backends.py
+# Where chat completions for text-to-SQL come from, chosen with LLM_BACKEND:
+#   openai     any OpenAI-compatible endpoint (the HF router, vLLM, the stub)
+#   llama_cpp  a quantized GGUF model loaded in-process with llama-cpp-python,
+#              for air-gapped or high-throughput deployments
+# Other backends can be added with register_backend().
+import os
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+
+from observability import metrics
+
+# llama_cpp: the GGUF file, context size and CPU threads (0 = llama.cpp's default)
+MODEL_PATH = os.getenv("LLM_MODEL_PATH")
+N_CTX = int(os.getenv("LLM_N_CTX", "4096"))
+N_THREADS = int(os.getenv("LLM_N_THREADS", "0"))
+MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "512"))
+# llama_cpp runs one request at a time. Requests arriving within the window
+# (up to BATCH_SIZE of them) are reordered so that those sharing a prompt
+# prefix run back to back; they are still decoded one after another.
+BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "8"))
+BATCH_WINDOW = float(os.getenv("LLM_BATCH_WINDOW", "0.01"))
+# Memory for KV states of earlier prompts; a new prompt resumes from the
+# longest cached prefix (the chat template and schema preamble)
+PREFIX_CACHE_BYTES = int(os.getenv("LLM_PREFIX_CACHE_BYTES", str(512 * 1024 * 1024)))
+
+
+class Backend(ABC):
+    name = None
+
+    def __init__(self, model: str, **options):
+        self.model = model
+
+    # Assistant reply for a list of chat messages
+    @abstractmethod
+    def complete(self, messages: list) -> str:
+        ...
+
+    # Load weights and prime caches ahead of the first real request
+    def warmup(self, messages: list = None):
+        pass
+
+    def close(self):
+        pass
+
+
+class OpenAIBackend(Backend):
+    name = "openai"
+
+    def __init__(self, model: str, base_url: str = None, api_key: str = None, **options):
+        super().__init__(model)
+        from openai import OpenAI
+
+        self.client = OpenAI(base_url=base_url, api_key=api_key)
+
+    def complete(self, messages: list) -> str:
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+        )
+        return response.choices[0].message.content
+
+
+# Serializes calls made from many threads onto one worker thread. Calls that
+# arrive within `window` of each other are handed to fn together, so it can
+# choose their order; this does not run them in parallel.
+# fn takes a list of items and returns one result (or exception) per item.
+class SerialDispatcher:
+    def __init__(self, fn, max_batch: int = BATCH_SIZE, window: float = BATCH_WINDOW, name: str = "llm-dispatcher"):
+        self.fn = fn
+        self.max_batch = max(1, max_batch)
+        self.window = window
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name=name)
+        self._thread.start()
+
+    def submit(self, item, timeout: float = None):
+        future = Future()
+        self._queue.put((item, future))
+        return future.result(timeout)
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                self._queue.put(None)  # finish this batch, then stop
+                break
+            batch.append(entry)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            metrics.incr("llm_request_groups")
+            metrics.incr("llm_grouped_requests", len(batch))
+            try:
+                results = self.fn([item for item, _ in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+def _prompt_key(messages: list) -> tuple:
+    return tuple(m["content"] for m in messages)
+
+
+class LlamaCppBackend(Backend):
+    name = "llama_cpp"
+
+    def __init__(self, model: str, model_path: str = MODEL_PATH, n_ctx: int = N_CTX, n_threads: int = N_THREADS,
+                 max_tokens: int = MAX_TOKENS, prefix_cache_bytes: int = PREFIX_CACHE_BYTES,
+                 batch_size: int = BATCH_SIZE, batch_window: float = BATCH_WINDOW, **options):
+        super().__init__(model)
+        try:
+            from llama_cpp import Llama, LlamaRAMCache
+        except ImportError:
+            raise RuntimeError("LLM_BACKEND=llama_cpp needs llama-cpp-python (pip install llama-cpp-python)") from None
+        if not model_path:
+            raise RuntimeError("LLM_BACKEND=llama_cpp needs LLM_MODEL_PATH pointing at a GGUF model file")
+
+        self.max_tokens = max_tokens
+        with metrics.span("llm_load", backend=self.name):
+            self._llm = Llama(model_path=str(model_path), n_ctx=n_ctx, n_threads=n_threads or None, verbose=False)
+        if prefix_cache_bytes:
+            self._llm.set_cache(LlamaRAMCache(capacity_bytes=prefix_cache_bytes))
+        # The model holds one context and is not thread-safe: every call goes
+        # through the dispatcher's thread
+        self._dispatcher = SerialDispatcher(self._complete_batch, batch_size, batch_window, name="llama-cpp")
+
+    def complete(self, messages: list) -> str:
+        return self._dispatcher.submit(messages)
+
+    # Sequences are decoded one after another on the single warm context.
+    # Sorting by prompt puts requests with the same schema preamble next to
+    # each other, so each one reuses the KV state the previous one left.
+    def _complete_batch(self, batch: list) -> list:
+        results = [None] * len(batch)
+        for i in sorted(range(len(batch)), key=lambda i: _prompt_key(batch[i])):
+            try:
+                response = self._llm.create_chat_completion(
+                    messages=batch[i], temperature=0.0, max_tokens=self.max_tokens)
+                results[i] = response["choices"][0]["message"]["content"]
+            except Exception as e:
+                results[i] = e
+        return results
+
+    def warmup(self, messages: list = None):
+        if messages:
+            with metrics.span("llm_warmup", backend=self.name):
+                self.complete(messages)
+
+    def close(self):
+        self._dispatcher.close()
+
+
+BACKENDS = {
+    OpenAIBackend.name: OpenAIBackend,
+    LlamaCppBackend.name: LlamaCppBackend,
+}
+
+
+def register_backend(cls):
+    BACKENDS[cls.name] = cls
+    return cls
+
+
+def create_backend(name: str, model: str, **options) -> Backend:
+    cls = BACKENDS.get(name)
+    if cls is None:
+        raise ValueError(f"Unknown LLM_BACKEND {name!r}; expected one of {', '.join(sorted(BACKENDS))}")
+    return cls(model, **options)
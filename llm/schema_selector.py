@@ -0,0 +1,124 @@
+# llm/schema_selector.py
+import re
+from collections import deque
+
+# Business vocabulary → table it points at
+SYNONYMS = {
+    "claim": "claims", "loss": "claims", "losses": "claims", "payout": "claims",
+    "adjuster": "claims", "incident": "claims", "reported": "claims", "resolved": "claims",
+    "settled": "claims", "denied": "claims", "theft": "claims", "fire": "claims",
+    "flood": "claims", "accident": "claims", "liability": "claims",
+    "policy": "policies", "premium": "policies", "premiums": "policies", "coverage": "policies",
+    "term": "policies", "renewal": "policies", "expiring": "policies", "written": "policies",
+    "customer": "customers", "client": "customers", "policyholder": "customers",
+    "insured": "customers", "income": "customers", "age": "customers", "demographic": "customers",
+    "broker": "brokers", "agent": "brokers", "agency": "brokers", "rating": "brokers",
+    "intermediary": "brokers",
+}
+# Phrases that need several tables at once
+PHRASES = {
+    "loss ratio": ("claims", "policies"),
+    "claims ratio": ("claims", "policies"),
+    "claim frequency": ("claims", "policies"),
+}
+
+
+def _words(text: str) -> list:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def _singular(word: str) -> str:
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+# Precomputed lookup structures for one schema; build once, reuse per question
+class SchemaIndex:
+    def __init__(self, schema: dict, synonyms: dict = SYNONYMS, phrases: dict = PHRASES):
+        self.tables = list(schema)
+        self.phrases = {p: tuple(t for t in ts if t in schema) for p, ts in phrases.items()}
+        self.vocab = {}  # word -> {table: weight}
+
+        def add(word, table, weight):
+            bucket = self.vocab.setdefault(word, {})
+            bucket[table] = max(bucket.get(table, 0), weight)
+
+        for table, meta in schema.items():
+            add(table.lower(), table, 3)
+            add(_singular(table.lower()), table, 3)
+            for column in meta["columns"]:
+                for word in _words(column.replace("_", " ")):
+                    add(_singular(word), table, 1)
+        for word, table in synonyms.items():
+            if table in schema:
+                add(_singular(word), table, 2)
+
+        # Join graph: tables are linked by a column that is another table's primary key
+        keys = {meta.get("primary_key"): table for table, meta in schema.items()}
+        self.edges = {table: set() for table in schema}
+        for table, meta in schema.items():
+            for column in meta["columns"]:
+                owner = keys.get(column)
+                if owner and owner != table:
+                    self.edges[table].add(owner)
+                    self.edges[owner].add(table)
+
+    # Generic words like "id" or "date" appear in every table; they only count
+    # when nothing more specific matched
+    def _scores(self, text: str) -> dict:
+        scores = {}
+        lowered = " ".join(_words(text))
+        for phrase, tables in self.phrases.items():
+            if phrase in lowered:
+                for table in tables:
+                    scores[table] = scores.get(table, 0) + 3
+        for word in _words(text):
+            bucket = self.vocab.get(_singular(word))
+            if not bucket or len(bucket) == len(self.tables):
+                continue
+            for table, weight in bucket.items():
+                scores[table] = scores.get(table, 0) + weight
+        return scores
+
+    def _path(self, start: str, goals: set) -> list:
+        parents = {start: None}
+        frontier = deque([start])
+        while frontier:
+            node = frontier.popleft()
+            if node in goals:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parents[node]
+                return path
+            for nxt in sorted(self.edges[node]):
+                if nxt not in parents:
+                    parents[nxt] = node
+                    frontier.append(nxt)
+        return []
+
+    # Tables a question plausibly needs, in schema order. Matches are closed
+    # over the join graph so every picked table can be joined to the others.
+    # Returns None when nothing matched and the full schema should be used.
+    def select(self, question: str, context_sql: str = None, min_score: int = 2):
+        scores = self._scores(question)
+        picked = {t for t, s in scores.items() if s >= min_score}
+        if context_sql:
+            context = set(_words(context_sql))
+            picked |= {t for t in self.tables if t.lower() in context}
+        if not picked:
+            return None
+
+        ordered = sorted(picked, key=lambda t: -scores.get(t, 0))
+        connected = {ordered[0]}
+        for table in ordered[1:]:
+            if table not in connected:
+                connected.update(self._path(table, connected) or [table])
+        return [t for t in self.tables if t in connected]
+
+
+def select_tables(question: str, schema: dict, context_sql: str = None):
+    return SchemaIndex(schema).select(question, context_sql)
@@ -0,0 +1,280 @@
+# llm/sql_cache.py
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: processes sharing the file are not coordinated
+    fcntl = None
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+CACHE_PATH = Path(os.getenv("SQL_CACHE_PATH", ROOT_DIR / ".cache" / "sql_cache.json"))
+MAX_ENTRIES = int(os.getenv("SQL_CACHE_MAX_ENTRIES", "2000"))
+TTL_SECONDS = float(os.getenv("SQL_CACHE_TTL", str(24 * 3600)))
+# Seconds between a put and rewriting the file, so a burst of puts costs one
+# write; 0 writes after every put (still outside the cache lock)
+FLUSH_DELAY = float(os.getenv("SQL_CACHE_FLUSH_DELAY", "1"))
+# Token-set similarity needed for a paraphrase to reuse cached SQL; 0 disables it
+SIMILARITY_THRESHOLD = float(os.getenv("SQL_CACHE_SIMILARITY", "0"))
+
+# Words that do not change what a question asks for
+STOPWORDS = {
+    "a", "an", "the", "of", "for", "in", "on", "by", "per", "to", "and", "is", "are",
+    "was", "were", "be", "what", "whats", "which", "show", "me", "give", "list", "find",
+    "get", "tell", "please", "can", "you", "i", "we", "our", "my", "s", "do", "does",
+    "how", "with", "each", "all", "from", "that", "this", "there",
+}
+
+
+# Lowercase, drop punctuation and collapse whitespace. Comparison and
+# arithmetic operators change the answer, so they are kept as tokens of
+# their own ("amount>5000" and "amount > 5000" normalize alike).
+def normalize_question(question: str) -> str:
+    text = question.lower().replace("'", "")
+    text = re.sub(r"[^a-z0-9_.<>=!%+*/-]+|!(?!=)", " ", text)
+    text = re.sub(r"([<>=!]+|[%+*/])", r" \1 ", text)
+    return " ".join(text.split())
+
+
+def question_tokens(question: str) -> frozenset:
+    return frozenset(t for t in normalize_question(question).split() if t not in STOPWORDS)
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+def schema_fingerprint(schema: dict) -> str:
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+# Serialize rewrites of a cache file across processes
+@contextmanager
+def _file_lock(path: Path):
+    if fcntl is None:
+        yield
+        return
+    with open(path.with_suffix(".lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# Process-wide NL→SQL cache shared by all sessions and persisted to disk.
+# Exact hits are keyed on the normalized question plus everything else that
+# changes the answer (context SQL, model, schema). Near-duplicate lookup
+# only compares questions sharing that same context.
+# Puts are written back in the background, merged with whatever other
+# processes saved to the same file in the meantime.
+class SQLCache:
+    def __init__(self, path: Path = CACHE_PATH, max_entries: int = MAX_ENTRIES,
+                 ttl: float = TTL_SECONDS, similarity_threshold: float = SIMILARITY_THRESHOLD,
+                 flush_delay: float = FLUSH_DELAY):
+        self.path = Path(path) if path else None
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.flush_delay = flush_delay
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._dirty = False
+        self._flush_timer = None
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load()
+        if self.path:
+            atexit.register(self.flush)
+
+    @staticmethod
+    def _context_key(context_sql: str, model: str, schema_hash: str) -> str:
+        context = " ".join((context_sql or "").split())
+        return _digest(context, model, schema_hash)
+
+    def _read(self) -> dict:
+        if not self.path or not self.path.exists():
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, entries: dict):
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp, self.path)
+
+    def _load(self):
+        now = time.time()
+        for key, entry in self._read().items():
+            if not self._expired(entry, now):
+                self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    # Write the file soon (after flush_delay), or now when there is no delay
+    def _schedule_flush(self):
+        if not self.path:
+            return
+        if self.flush_delay <= 0:
+            self.flush()
+            return
+        with self._lock:
+            if self._flush_timer is not None:
+                return
+            self._flush_timer = threading.Timer(self.flush_delay, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    # Write pending puts. Entries only on disk (saved by another process) are
+    # kept, as the least recently used; ours win where both have a key.
+    # Lookups only wait for the snapshot, not for the file.
+    def flush(self):
+        if not self.path:
+            return
+        with self._flush_lock:
+            with self._lock:
+                self._flush_timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                entries = dict(self._entries)
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with _file_lock(self.path):
+                    now = time.time()
+                    merged = {key: entry for key, entry in self._read().items()
+                              if key not in entries and not self._expired(entry, now)}
+                    merged.update(entries)
+                    for key in list(merged)[:max(0, len(merged) - self.max_entries)]:
+                        del merged[key]
+                    self._write(merged)
+            except Exception:
+                with self._lock:
+                    self._dirty = True
+                raise
+
+    def _expired(self, entry: dict, now: float) -> bool:
+        return now - entry["created"] >= self.ttl
+
+    # Live entry for a key, marked as recently used. Caller holds the lock.
+    def _lookup(self, key: str, now: float):
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(entry, now):
+            del self._entries[key]
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    # Add or replace an entry and evict the least recently used ones. Caller
+    # holds the lock, and calls _schedule_flush() once it has released it.
+    def _store(self, key: str, entry: dict):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        self._dirty = True
+
+    def get(self, question: str, context_sql: str, model: str, schema_hash: str):
+        context_key = self._context_key(context_sql, model, schema_hash)
+        key = _digest(normalize_question(question), context_key)
+        now = time.time()
+        with self._lock:
+            entry = self._lookup(key, now)
+            if entry is not None:
+                self.hits += 1
+                return entry["sql"]
+
+            if self.similarity_threshold > 0:
+                match = self._nearest(question_tokens(question), context_key, now)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.similar_hits += 1
+                    return self._entries[match]["sql"]
+
+            self.misses += 1
+            return None
+
+    # Best token-set match within the same context. Numbers must agree
+    # exactly so "top 5" never reuses the SQL for "top 10".
+    def _nearest(self, tokens: frozenset, context_key: str, now: float):
+        numbers = {t for t in tokens if t[0].isdigit()}
+        best_key, best_score = None, self.similarity_threshold
+        for key, entry in self._entries.items():
+            if entry["context"] != context_key or self._expired(entry, now):
+                continue
+            other = frozenset(entry["tokens"])
+            if {t for t in other if t[0].isdigit()} != numbers:
+                continue
+            score = _jaccard(tokens, other)
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def put(self, question: str, context_sql: str, model: str, schema_hash: str, sql: str):
+        context_key = self._context_key(context_sql, model, schema_hash)
+        key = _digest(normalize_question(question), context_key)
+        with self._lock:
+            self._store(key, {
+                "sql": sql,
+                "created": time.time(),
+                "context": context_key,
+                "tokens": sorted(question_tokens(question)),
+            })
+        self._schedule_flush()
+
+    # Empty the cache and its file (for every process sharing it)
+    def clear(self):
+        with self._flush_lock:
+            with self._lock:
+                self._entries.clear()
+                self._dirty = False
+            if self.path:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with _file_lock(self.path):
+                    self._write({})
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_sql_cache() -> SQLCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SQLCache()
+    return _cache
@@ -0,0 +1,185 @@
+# llm/stub_server.py
+# Local, deterministic stand-in for the OpenAI chat-completions API.
+# Point the agent at it with LLM_BASE_URL=http://127.0.0.1:<port>/v1
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Question keyword → grouping column
+GROUP_COLUMNS = [
+    ("line of business", "LINE_OF_BUSINESS"),
+    ("broker", "BROKER_ID"),
+    ("state", "STATE"),
+    ("status", "CLAIM_STATUS"),
+    ("type", "CLAIM_TYPE"),
+]
+STATUS_WORDS = {"closed": "Closed", "open": "Open", "denied": "Denied", "pending": "Pending"}
+
+
+# Deterministic SQL for a question, good enough to exercise the pipeline
+def stub_sql(question: str) -> str:
+    q = question.lower()
+    if "average" in q or "avg" in q or "mean" in q:
+        measure = "AVG(CLAIM_AMOUNT) AS avg_claim_amount"
+    elif "how many" in q or "count" in q or "number of" in q:
+        measure = "COUNT(*) AS claim_count"
+    else:
+        measure = "SUM(CLAIM_AMOUNT) AS total_claim_amount"
+
+    group = next((col for word, col in GROUP_COLUMNS if word in q), None)
+    status = next((value for word, value in STATUS_WORDS.items() if re.search(rf"\b{word}\b", q)), None)
+
+    select = f"{group}, {measure}" if group else measure
+    sql = f"SELECT {select} FROM claims"
+    if status:
+        sql += f" WHERE CLAIM_STATUS = '{status}'"
+    if group:
+        sql += f" GROUP BY {group} ORDER BY {group}"
+    return sql + ";"
+
+
+# Pull the question back out of the messages built by text2sql_agent (the
+# first user turn; later turns are repair requests)
+def _question_from_messages(messages: list) -> str:
+    user = next((m["content"] for m in messages if m.get("role") == "user"), "")
+    follow_up = re.search(r'Now they asked: "(.*)"', user, re.S)
+    if follow_up:
+        return follow_up.group(1)
+    return user.split("answer:", 1)[-1].strip()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so clients can reuse connections
+    disable_nagle_algorithm = True  # headers and body go out as separate small writes
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": self.server.model, "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            failure = server.failures.pop(0) if server.failures else None
+        if failure == "pending":
+            self._send_json(503, {"error": {"message": "Model is loading", "code": "model_pending_deploy"}})
+            return
+        if failure == "rate_limit":
+            self._send_json(429, {"error": {"message": "Rate limit exceeded", "code": "rate_limit_exceeded"}})
+            return
+
+        time.sleep(server.latency)
+        sql = stub_sql(_question_from_messages(request.get("messages", [])))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = request.get("model", server.model)
+
+        if not request.get("stream"):
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": sql},
+                    "finish_reason": "stop",
+                }],
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in re.findall(r"\S+\s*", sql):
+            time.sleep(server.token_delay)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        done = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        self._write_chunk(f"data: {json.dumps(done)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # failures: queue of "pending" / "rate_limit" responses served before normal ones
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 token_delay: float = 0.0, model: str = "stub-sqlcoder", failures: list = None):
+        super().__init__((host, port), StubHandler)
+        self.latency = latency
+        self.token_delay = token_delay
+        self.model = model
+        self.failures = list(failures or [])
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    # Clients hanging up mid-stream (timeouts, cancellations) are expected
+    def handle_error(self, request, client_address):
+        pass
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+# Start a stub server on a background thread; call .shutdown() when done
+def serve_in_thread(**kwargs) -> StubServer:
+    server = StubServer(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub for text-to-SQL")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed tokens")
+    args = parser.parse_args()
+
+    server = StubServer(args.host, args.port, latency=args.latency, token_delay=args.token_delay)
+    print(f"Stub LLM listening on {server.base_url}")
+    server.serve_forever()
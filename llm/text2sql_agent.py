@@ -1,26 +1,80 @@
 import os
 import json
+import threading
 from pathlib import Path
 from dotenv import load_dotenv
-from openai import OpenAI
+
+from llm import backends
+from llm.schema_selector import SchemaIndex
+from llm.sql_cache import get_sql_cache, schema_fingerprint
+from observability import metrics
 
 # Load token from .env
 load_dotenv()
 HF_TOKEN = os.getenv("HF_TOKEN")
+# "openai" (remote, OpenAI-compatible) or "llama_cpp" (local GGUF), see llm/backends.py
+BACKEND = os.getenv("LLM_BACKEND", "openai")
+# Part of every cache key; a local model is named after its file unless set
+MODEL = os.getenv("LLM_MODEL") or (
+    Path(os.getenv("LLM_MODEL_PATH", "local.gguf")).name if BACKEND == "llama_cpp"
+    else "defog/llama-3-sqlcoder-8b:featherless-ai")
+# Point at any OpenAI-compatible endpoint, e.g. the local stub in llm/stub_server.py
+BASE_URL = os.getenv("LLM_BASE_URL", "https://router.huggingface.co/v1")
+# Send only the tables a question plausibly needs instead of the whole schema
+PRUNE_SCHEMA = os.getenv("LLM_PRUNE_SCHEMA", "1") not in ("0", "false", "False")
+SCHEMA_PATH = Path(__file__).resolve().parent.parent / "schema" / "db_schema.json"
+
+# One backend per process, so a local model is loaded once and stays warm
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> backends.Backend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = backends.create_backend(BACKEND, MODEL, base_url=BASE_URL, api_key=HF_TOKEN)
+    return _backend
+
+# Parsed schema plus everything derived from it, keyed by file path and
+# reloaded only when the file's mtime or size changes
+_schema_cache = {}
+_schema_lock = threading.Lock()
+MAX_CACHED_PROMPTS = 512
 
-# Initialize HF-compatible OpenAI client
-client = OpenAI(
-    base_url="https://router.huggingface.co/v1",
-    api_key=HF_TOKEN,
-)
 
-# Load schema from project root regardless of working directory
+def _schema_entry(schema_path: str = None) -> dict:
+    path = Path(schema_path or SCHEMA_PATH).resolve()
+    stat = path.stat()
+    version = (stat.st_mtime_ns, stat.st_size)
+    entry = _schema_cache.get(path)
+    if entry is not None and entry["version"] == version:
+        return entry
+
+    with _schema_lock:
+        entry = _schema_cache.get(path)
+        if entry is None or entry["version"] != version:
+            with metrics.span("load_schema"), open(path, "r") as f:
+                schema = json.load(f)
+            entry = {
+                "version": version,
+                "schema": schema,
+                "fingerprint": schema_fingerprint(schema),
+                "index": SchemaIndex(schema),
+                "prompts": {},
+            }
+            _schema_cache[path] = entry
+    return entry
+
+# Load schema from project root regardless of working directory.
+# The returned dict is shared between callers; do not modify it.
 def load_schema(schema_path: str = None) -> dict:
-    if schema_path is None:
-        base_dir = Path(__file__).resolve().parent.parent
-        schema_path = base_dir / "schema" / "db_schema.json"
-    with open(schema_path, "r") as f:
-        return json.load(f)
+    return _schema_entry(schema_path)["schema"]
+
+# Fingerprint of the schema file contents, for cache keys
+def schema_hash(schema_path: str = None) -> str:
+    return _schema_entry(schema_path)["fingerprint"]
 
 # Format schema for LLM prompt
 def format_schema_for_prompt(schema: dict) -> str:
@@ -38,28 +92,89 @@ def build_messages(question: str, schema: dict) -> list:
         {"role": "user", "content": f"Write an SQL query to answer: {question}"},
     ]
 
+# Memoized schema prompt, optionally restricted to a subset of tables
+def schema_prompt(schema_path: str = None, tables: list = None) -> str:
+    entry = _schema_entry(schema_path)
+    key = tuple(tables) if tables else None
+    prompt = entry["prompts"].get(key)
+    if prompt is None:
+        schema = entry["schema"]
+        if tables:
+            schema = {t: schema[t] for t in tables}
+        prompt = format_schema_for_prompt(schema)
+        if len(entry["prompts"]) >= MAX_CACHED_PROMPTS:
+            entry["prompts"].clear()
+        entry["prompts"][key] = prompt
+    return prompt
 
-def generate_sql(question: str, schema_path: str = None, context_sql: str = None) -> str:
-    schema = load_schema(schema_path)
+# Chat messages for a question, with the schema pruned to relevant tables.
+# With failed_sql/error, the model is asked to fix its earlier attempt.
+def prepare_messages(question: str, schema_path: str = None, context_sql: str = None,
+                     prune: bool = PRUNE_SCHEMA, failed_sql: str = None, error: str = None) -> list:
+    tables = None
+    if prune:
+        tables = _schema_entry(schema_path)["index"].select(question, context_sql or failed_sql)
+    messages = [
+        {"role": "system", "content": schema_prompt(schema_path, tables)},
+        {"role": "user", "content": f"Write an SQL query to answer: {build_prompt(question, context_sql)}"},
+    ]
+    if failed_sql:
+        messages += [
+            {"role": "assistant", "content": failed_sql},
+            {"role": "user", "content": build_repair_prompt(error)},
+        ]
+    return messages
 
-    if context_sql:
-        prompt = f"""The user previously ran this SQL:
+# Wrap a follow-up question with the SQL it builds on
+def build_prompt(question: str, context_sql: str = None) -> str:
+    if not context_sql:
+        return question
+    return f"""The user previously ran this SQL:
 
 {context_sql}
 
 Now they asked: "{question}"
 
 Generate follow-up SQL based on the previous context and the current question."""
-    else:
-        prompt = question
 
-    messages = build_messages(prompt, schema)
+# Follow-up turn asking the model to fix SQL that DuckDB rejected
+def build_repair_prompt(error: str) -> str:
+    return f"""That query fails in DuckDB with this error:
+
+{error}
+
+Return only the corrected DuckDB SQL query."""
+
+
+# Load the model and run one full-schema prompt, so the schema preamble is
+# already in the backend's prefix cache when the first question arrives
+def warmup(schema_path: str = None):
+    get_backend().warmup(prepare_messages("How many claims are there?", schema_path, prune=False))
+
+
+@metrics.timed("generate_sql")
+def generate_sql(question: str, schema_path: str = None, context_sql: str = None,
+                 use_cache: bool = True, failed_sql: str = None, error: str = None) -> str:
+    # Reuse SQL for a question already answered in any session; repairs are
+    # cached by pipeline.repair instead
+    cache = get_sql_cache() if use_cache and not failed_sql else None
+    if cache is not None:
+        fingerprint = schema_hash(schema_path)
+        cached = cache.get(question, context_sql, MODEL, fingerprint)
+        metrics.incr("sql_cache", result="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+
+    with metrics.span("prompt_build"):
+        messages = prepare_messages(question, schema_path, context_sql,
+                                    failed_sql=failed_sql, error=error)
+
+    with metrics.span("llm_request", mode="sync", backend=BACKEND):
+        sql = get_backend().complete(messages).strip()
 
-    response = client.chat.completions.create(
-        model="defog/llama-3-sqlcoder-8b:featherless-ai",
-        messages=messages,
-    )
-    return response.choices[0].message.content.strip()
+    if cache is not None:
+        cache.put(question, context_sql, MODEL, fingerprint, sql)
+    return sql
 
 
 # Example usage
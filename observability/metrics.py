@@ -0,0 +1,280 @@
+# observability/metrics.py
+# Timing spans and counters for the hot paths, exported through pluggable sinks:
+#   METRICS_SINKS=jsonlog,prometheus_file,prometheus_http
+#   METRICS_FILE=metrics.prom  METRICS_PORT=9108
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "genai"
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger("genai.metrics")
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: tuple) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in key) + "}"
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# In-process store of counters and span-duration histograms
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}  # (name, label key) -> value
+        self.histograms = {}  # (span, label key) -> Histogram
+
+    def incr(self, name: str, value: float, labels: dict):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, span: str, seconds: float, labels: dict):
+        key = (span, _label_key(labels))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    # Prometheus text exposition format
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        seen = set()
+        for (name, key), value in counters:
+            metric = f"{PREFIX}_{name}_total"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} counter")
+                seen.add(metric)
+            lines.append(f"{metric}{_format_labels(key)} {value:g}")
+
+        metric = f"{PREFIX}_span_duration_seconds"
+        if histograms:
+            lines.append(f"# TYPE {metric} histogram")
+        for (span, key), hist in histograms:
+            base = (("span", span),) + key
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), hist.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{metric}_bucket{_format_labels(base + (('le', le),))} {cumulative}")
+            lines.append(f"{metric}_sum{_format_labels(base)} {hist.sum:.6f}")
+            lines.append(f"{metric}_count{_format_labels(base)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+registry = Registry()
+_sinks = []
+_trace = contextvars.ContextVar("genai_metrics_trace", default=None)
+
+
+# A sink receives every event as a dict: {"type": "span"|"counter", ...}
+def add_sink(sink):
+    _sinks.append(sink)
+
+
+def remove_sink(sink):
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def _emit(event: dict):
+    for sink in list(_sinks):
+        try:
+            sink(event)
+        except Exception:
+            logger.exception("metrics sink failed")
+
+
+def incr(name: str, value: float = 1, **labels):
+    registry.incr(name, value, labels)
+    if _sinks:
+        _emit({"type": "counter", "name": name, "value": value, "labels": labels, "ts": time.time()})
+
+
+# Record a duration measured elsewhere (e.g. queue wait from timestamps)
+def observe(name: str, seconds: float, **labels):
+    registry.observe(name, seconds, labels)
+    if _sinks:
+        _emit({"type": "span", "name": name, "seconds": seconds, "labels": labels,
+               "error": None, "ts": time.time()})
+
+
+# Time a block. The duration goes to the span histogram, to the sinks and to
+# the active trace() of the current context, if any.
+@contextmanager
+def span(name: str, **labels):
+    start = time.perf_counter()
+    error = None
+    try:
+        yield labels
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        registry.observe(name, seconds, labels)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append({"span": name, "ms": round(seconds * 1000, 3), **labels})
+        if error is not None:
+            registry.incr("span_errors", 1, {"span": name, "error": error})
+        if _sinks:
+            _emit({"type": "span", "name": name, "seconds": seconds, "labels": labels,
+                   "error": error, "ts": time.time()})
+
+
+def timed(name: str = None):
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Collect the spans recorded in this context, e.g. for one query in the UI
+@contextmanager
+def trace():
+    spans = []
+    token = _trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _trace.reset(token)
+
+
+# --------------------------
+# Sinks
+# --------------------------
+
+# One JSON log line per event on the "genai.metrics" logger
+class JsonLogSink:
+    def __init__(self, log: logging.Logger = logger, level: int = logging.INFO):
+        self.log = log
+        self.level = level
+
+    def __call__(self, event: dict):
+        self.log.log(self.level, json.dumps(event, default=str))
+
+
+# Rewrite a Prometheus text file every `interval` seconds (node_exporter textfile style)
+class PrometheusFileSink:
+    def __init__(self, path: str, interval: float = 10.0):
+        self.path = path
+        self.interval = interval
+        thread = threading.Thread(target=self._loop, daemon=True, name="metrics-file")
+        thread.start()
+
+    def __call__(self, event: dict):
+        pass  # the registry already holds the state; flushed by the timer
+
+    def flush(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(registry.render_prometheus())
+        os.replace(tmp, self.path)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except OSError:
+                logger.exception("could not write %s", self.path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# Serve /metrics for Prometheus scraping from a daemon thread
+def start_http_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    return server
+
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+# Install the sinks named in METRICS_SINKS; safe to call more than once
+def configure_from_env():
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        _configured = True
+        names = {s.strip() for s in os.getenv("METRICS_SINKS", "").split(",") if s.strip()}
+        if "jsonlog" in names:
+            if not logger.handlers:
+                handler = logging.StreamHandler()
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+                logger.setLevel(logging.INFO)
+            add_sink(JsonLogSink())
+        if "prometheus_file" in names:
+            add_sink(PrometheusFileSink(os.getenv("METRICS_FILE", "metrics.prom"),
+                                        float(os.getenv("METRICS_FILE_INTERVAL", "10"))))
+        if "prometheus_http" in names:
+            try:
+                start_http_server(int(os.getenv("METRICS_PORT", "9108")))
+            except OSError:
+                # Another process (or Streamlit rerun) already serves the port
+                logger.warning("metrics port %s already in use", os.getenv("METRICS_PORT", "9108"))
+
+
+configure_from_env()
@@ -0,0 +1,138 @@
+# pipeline/batch.py
+# Bulk text-to-SQL: questions in from JSONL, one result line out per question
+# as soon as it finishes. Usage:
+#   python -m pipeline.batch questions.jsonl -o results.jsonl --concurrency 16
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+from backend import resources
+from backend.engine import POOL_SIZE
+from backend.query_executor import run_sql_arrow
+from backend.results import strip_sql
+from llm.async_client import agenerate_sql
+from llm.sql_cache import normalize_question
+
+DEFAULT_CONCURRENCY = 8
+
+
+# Yield {"id", "question", "context_sql"} per input line, skipping repeats of
+# an earlier (question, context_sql) pair. Only the keys are kept in memory.
+def read_questions(path: Path, stats: dict):
+    seen = set()
+    with open(path, "r") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"question": item}
+            question = item["question"]
+            context_sql = item.get("context_sql")
+            key = (normalize_question(question), " ".join((context_sql or "").split()))
+            if key in seen:
+                stats["duplicates"] += 1
+                continue
+            seen.add(key)
+            yield {"id": item.get("id", line_no), "question": question, "context_sql": context_sql}
+
+
+# Only the row count is recorded, so the rows themselves are never fetched,
+# converted or cached
+def _count_rows(sql: str) -> int:
+    table = run_sql_arrow(f"SELECT count(*) FROM (\n{strip_sql(sql)}\n) AS q")
+    return table.column(0)[0].as_py()
+
+
+async def _process(item: dict, execute: bool, exec_slots: asyncio.Semaphore) -> dict:
+    record = {
+        "id": item["id"],
+        "question": item["question"],
+        "context_sql": item["context_sql"],
+        "sql": None,
+        "row_count": None,
+        "generate_ms": None,
+        "execute_ms": None,
+        "error": None,
+    }
+    start = time.perf_counter()
+    try:
+        record["sql"] = await agenerate_sql(item["question"], context_sql=item["context_sql"])
+        record["generate_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+        if execute:
+            # DuckDB work runs on threads; bound it to the engine's pool
+            async with exec_slots:
+                exec_start = time.perf_counter()
+                record["row_count"] = await asyncio.to_thread(_count_rows, record["sql"])
+                record["execute_ms"] = round((time.perf_counter() - exec_start) * 1000, 2)
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return record
+
+
+# Run every question in input_path and append results to output_path as they
+# complete. At most `concurrency` questions are in flight at once, so memory
+# stays flat however long the input is.
+async def arun_batch(input_path, output_path, concurrency: int = DEFAULT_CONCURRENCY,
+                     execute: bool = True, exec_concurrency: int = None) -> dict:
+    stats = {"processed": 0, "errors": 0, "duplicates": 0}
+    exec_slots = asyncio.Semaphore((exec_concurrency or POOL_SIZE) if execute else 1)
+    if execute:
+        # Start the engine while the first questions are with the model
+        resources.warm(["engine"])
+    items = read_questions(Path(input_path), stats)
+    pending = set()
+    start = time.perf_counter()
+
+    with open(output_path, "w") as out:
+        def write(record: dict):
+            out.write(json.dumps(record, default=str) + "\n")
+            out.flush()
+            stats["processed"] += 1
+            stats["errors"] += record["error"] is not None
+
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < concurrency:
+                item = next(items, None)
+                if item is None:
+                    exhausted = True
+                    break
+                pending.add(asyncio.create_task(_process(item, execute, exec_slots)))
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                write(task.result())
+
+    elapsed = time.perf_counter() - start
+    stats["elapsed_s"] = round(elapsed, 3)
+    stats["questions_per_minute"] = round(stats["processed"] / elapsed * 60, 2) if elapsed else 0.0
+    return stats
+
+
+def run_batch(input_path, output_path, concurrency: int = DEFAULT_CONCURRENCY,
+              execute: bool = True, exec_concurrency: int = None) -> dict:
+    return asyncio.run(arun_batch(input_path, output_path, concurrency, execute, exec_concurrency))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate (and run) SQL for a JSONL file of questions")
+    parser.add_argument("input", help='JSONL with {"question": ..., "context_sql": ...} per line')
+    parser.add_argument("-o", "--output", required=True, help="JSONL file for results")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="questions in flight at once")
+    parser.add_argument("--exec-concurrency", type=int, default=None,
+                        help="queries executing at once (default: engine pool size)")
+    parser.add_argument("--no-execute", action="store_true", help="only generate SQL")
+    args = parser.parse_args()
+
+    summary = run_batch(args.input, args.output, args.concurrency,
+                        execute=not args.no_execute, exec_concurrency=args.exec_concurrency)
+    print(json.dumps(summary), file=sys.stderr)
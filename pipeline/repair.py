@@ -0,0 +1,237 @@
+# pipeline/repair.py
+# Generate → validate → repair. Generated SQL is checked with EXPLAIN (and
+# optionally executed); DuckDB's error goes back to the model together with
+# the failing SQL, within a retry budget and a deadline. Fixes are cached by
+# failure, so the same mistake never costs a second LLM call. Usage:
+#   python -m pipeline.repair "Average claim amount by month for 2024"
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import duckdb
+
+from backend import resources
+from backend.engine import get_engine
+from backend.guard import QueryRejected, check_query
+from backend.result_cache import canonicalize_sql
+from backend.results import ResultHandle
+from llm import text2sql_agent as agent
+from llm.sql_cache import SQLCache, get_sql_cache
+from observability import metrics
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from backend.guard import GuardDecision
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+CACHE_PATH = Path(os.getenv("REPAIR_CACHE_PATH", ROOT_DIR / ".cache" / "repair_cache.json"))
+MAX_ENTRIES = int(os.getenv("REPAIR_CACHE_MAX_ENTRIES", "1000"))
+# LLM repair rounds after the first attempt, and the wall clock for all of them
+MAX_REPAIRS = int(os.getenv("REPAIR_MAX_ATTEMPTS", "2"))
+DEADLINE = float(os.getenv("REPAIR_DEADLINE", "60"))
+
+# Errors that mean the SQL itself is wrong. Interrupts, out-of-memory and
+# I/O failures are not the model's to fix.
+NOT_REPAIRABLE = (duckdb.InterruptException, duckdb.OutOfMemoryException, duckdb.IOException)
+
+
+def is_repairable(exc: Exception) -> bool:
+    return isinstance(exc, duckdb.Error) and not isinstance(exc, NOT_REPAIRABLE)
+
+
+# First line of a DuckDB error: the kind and the message, without the
+# "LINE 1: ..." excerpt and candidate lists that follow
+def error_signature(error: str) -> str:
+    lines = (error or "").strip().splitlines()
+    return lines[0] if lines else ""
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+# Failing SQL + error → SQL that worked. Loading, saving and LRU eviction
+# are the SQL cache's; fixes do not expire, since the key already covers
+# the model and schema they were made for.
+class RepairCache(SQLCache):
+    def __init__(self, path: Path = CACHE_PATH, max_entries: int = MAX_ENTRIES):
+        super().__init__(path, max_entries, ttl=float("inf"), similarity_threshold=0)
+
+    @staticmethod
+    def key(sql: str, error: str, model: str, schema_hash: str) -> str:
+        return _digest(canonicalize_sql(sql), error_signature(error), model, schema_hash)
+
+    def get(self, sql: str, error: str, model: str, schema_hash: str):
+        key = self.key(sql, error, model, schema_hash)
+        with self._lock:
+            entry = self._lookup(key, time.time())
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry["sql"]
+
+    def put(self, sql: str, error: str, model: str, schema_hash: str, repaired: str):
+        key = self.key(sql, error, model, schema_hash)
+        with self._lock:
+            self._store(key, {"sql": repaired, "error": error_signature(error), "created": time.time()})
+        self._schedule_flush()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_repair_cache() -> RepairCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = RepairCache()
+    return _cache
+
+
+@dataclass
+class Attempt:
+    sql: str
+    source: str  # "generated", "repair_cache" or "repair"
+    error: str = None
+    stage: str = None  # "validate" or "execute" when it failed
+
+
+@dataclass
+class Answer:
+    question: str
+    sql: str = None  # the last SQL tried; it works when error is None
+    error: str = None
+    result: "pd.DataFrame" = field(default=None, repr=False)
+    decision: "GuardDecision" = None  # how the cost guard ran it, with execute=True
+    attempts: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def repaired(self) -> bool:
+        return self.error is None and len(self.attempts) > 1
+
+
+# Parse, bind and plan without running anything. Returns DuckDB's error, or None.
+def validate_sql(sql: str):
+    try:
+        with get_engine().cursor() as cur, metrics.span("validate_sql"):
+            cur.execute(f"EXPLAIN {sql.strip().rstrip(';')}")
+    except duckdb.Error as e:
+        if not is_repairable(e):
+            raise
+        return str(e)
+    return None
+
+
+# Fixed SQL for a failure, from the repair cache or the model
+def repair_sql(question: str, sql: str, error: str, schema_path: str = None,
+               context_sql: str = None, use_cache: bool = True):
+    cache = get_repair_cache() if use_cache else None
+    fingerprint = agent.schema_hash(schema_path)
+    if cache is not None:
+        cached = cache.get(sql, error, agent.MODEL, fingerprint)
+        metrics.incr("repair_cache", result="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached, "repair_cache"
+    fixed = agent.generate_sql(question, schema_path, context_sql, failed_sql=sql, error=error)
+    return fixed, "repair"
+
+
+# Run SQL the way the app does: the cost guard may cap or sample it, and
+# refuses it (QueryRejected) when it is too expensive to run unattended
+def run_guarded(sql: str):
+    decision = check_query(sql)
+    if decision.action == "confirm":
+        raise QueryRejected(decision.reason)
+    return decision, ResultHandle(decision.sql).to_pandas()
+
+
+# Generate SQL for a question and keep repairing it until it validates (and,
+# with execute=True, runs and returns its result) or the retry budget or
+# deadline is spent
+def answer(question: str, schema_path: str = None, context_sql: str = None, execute: bool = False,
+           max_repairs: int = MAX_REPAIRS, deadline: float = DEADLINE, use_cache: bool = True) -> Answer:
+    start = time.perf_counter()
+    result = Answer(question)
+    sql, source = agent.generate_sql(question, schema_path, context_sql, use_cache=use_cache), "generated"
+    while True:
+        attempt = Attempt(sql, source)
+        result.attempts.append(attempt)
+        attempt.error, attempt.stage = validate_sql(sql), "validate"
+        if attempt.error is None and execute:
+            try:
+                result.decision, result.result = run_guarded(sql)
+            except duckdb.Error as e:
+                if not is_repairable(e):
+                    raise
+                attempt.error, attempt.stage = str(e), "execute"
+        if attempt.error is None:
+            attempt.stage = None
+            break
+        if len(result.attempts) > max_repairs or time.perf_counter() - start > deadline:
+            break
+        with metrics.span("sql_repair", stage=attempt.stage):
+            sql, source = repair_sql(question, sql, attempt.error, schema_path, context_sql, use_cache)
+
+    result.sql, result.error = sql, result.attempts[-1].error
+    result.elapsed = time.perf_counter() - start
+    if result.repaired and use_cache:
+        _remember(result, schema_path, context_sql)
+    outcome = "failed" if result.error else "repaired" if result.repaired else "ok"
+    metrics.incr("sql_answers", outcome=outcome)
+    metrics.observe("time_to_working_sql", result.elapsed, outcome=outcome)
+    return result
+
+
+# Point every failure on the way, and the question itself, at the SQL that worked
+def _remember(result: Answer, schema_path: str, context_sql: str):
+    failures = [(a.sql, a.error) for a in result.attempts[:-1] if a.source != "repair_cache"]
+    remember_fix(result.question, failures, result.sql, schema_path, context_sql)
+
+
+# Record SQL that was confirmed to work after the given (sql, error) failures
+def remember_fix(question: str, failures: list, sql: str, schema_path: str = None, context_sql: str = None):
+    fingerprint = agent.schema_hash(schema_path)
+    cache = get_repair_cache()
+    for failed_sql, error in failures:
+        cache.put(failed_sql, error, agent.MODEL, fingerprint, sql)
+    get_sql_cache().put(question, context_sql, agent.MODEL, fingerprint, sql)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate SQL for a question, repairing it until it runs")
+    parser.add_argument("question")
+    parser.add_argument("--context-sql", help="SQL the question follows up on")
+    parser.add_argument("--execute", action="store_true", help="also run the SQL, repairing runtime errors")
+    parser.add_argument("--max-repairs", type=int, default=MAX_REPAIRS)
+    args = parser.parse_args(argv)
+
+    # The engine starts while the model writes the first attempt
+    resources.warm(["engine"])
+    result = answer(args.question, context_sql=args.context_sql, execute=args.execute,
+                    max_repairs=args.max_repairs)
+    for i, attempt in enumerate(result.attempts, 1):
+        status = "ok" if attempt.error is None else f"{attempt.stage} failed: {error_signature(attempt.error)}"
+        print(f"-- attempt {i} ({attempt.source}): {status}\n{attempt.sql}\n", file=sys.stderr)
+    print(f"-- {len(result.attempts)} attempt(s), {result.elapsed * 1000:.0f} ms", file=sys.stderr)
+    if result.decision is not None and result.decision.reason:
+        print(f"-- {result.decision.reason}", file=sys.stderr)
+    if result.error:
+        return 1
+    print(result.sql)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())